@@ -4,9 +4,10 @@ import discord
 from contextlib import redirect_stdout
 from io import BytesIO, StringIO
 from textwrap import indent
-from core.utils import get_logger
+from core.utils import get_logger, LANG_CATALOG
 from discord.ext import commands
 from core.context import StrapContext
+from core.youtube import resubscribe_channels
 from typing import Literal, Optional
 from datetime import datetime
 from strapbot import StrapBot
@@ -157,6 +158,55 @@ class Owners(commands.Cog):
     async def reload(self, ctx: StrapContext, ext: str):
         await self.load_ext(ctx, "reload", ext)
 
+    @commands.command()
+    async def reload_langs(self, ctx: StrapContext):
+        """Reload the translations from the langs folder."""
+        async with ctx.typing():
+            await self.bot.loop.run_in_executor(None, LANG_CATALOG.load)
+
+        logger.info(f"Reloaded {len(LANG_CATALOG.langs)} languages.")
+        await ctx.send("done", languages=len(LANG_CATALOG.langs))
+
+    @commands.command()
+    async def migrate_configs(self, ctx: StrapContext):
+        """Add new configurations' defaults to every entry in the database."""
+        async with ctx.typing():
+            ret = await self.bot.migrate_configs()
+
+        await ctx.send("done", modified=sum(ret.values()))
+
+    @commands.command()
+    async def resubscribe(self, ctx: StrapContext, restart: bool = False):
+        """Subscribe every YouTube channel again, after the server's URL changed."""
+        assert self.bot.youtube_news_available, "The server is down."
+        m = await ctx.send("running")
+
+        async def progress(done: int, failed: int, total: int):
+            await m.edit(
+                content=ctx.format_message(
+                    "progress", {"done": done, "failed": failed, "total": total}
+                )
+            )
+
+        async with ctx.typing():
+            ret = await resubscribe_channels(
+                self.bot.get_db("YouTubeNews", cog=False),
+                self.bot.get_db("Internal", cog=False),
+                lambda channel_id: self.bot.request_pubsubhubbub(channel_id, True),
+                self.bot.server_url,  #  type: ignore
+                restart=restart,
+                progress=progress,
+            )
+
+        if ret["failed"]:
+            logger.warning(f"Couldn't subscribe to {', '.join(ret['failed'])}.")
+
+        await m.reply(
+            ctx.format_message(
+                "done", {"done": ret["done"], "failed": len(ret["failed"])}
+            )
+        )
+
     @commands.command()
     async def error(self, ctx: StrapContext, code: str):
         db = self.bot.get_db("Errors", cog=False)
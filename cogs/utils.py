@@ -15,7 +15,7 @@ def server_online():
     async def check(ctx: StrapContext) -> bool:
         ps = ctx.channel.permissions_for(ctx.author)  # type: ignore
         p = ps.administrator or ps.manage_guild
-        return p and await ctx.bot.check_youtube_news()
+        return p and ctx.bot.youtube_news_available
 
     return commands.check(check)
 
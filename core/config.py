@@ -1,12 +1,18 @@
 import os
+import time
+import hashlib
 import discord
-from .utils import lang_exists, get_langs_properties, get_flag_emoji, get_logger
+from .utils import lang_exists, get_langs_properties, get_langs_index, get_logger
 from discord.ext import commands
 from discord import TextChannel, Thread, ChannelType, SelectOption
 from discord.enums import ComponentType, TextStyle
+from discord.utils import MISSING
 from enum import Enum
-from typing import Optional, Union, Type, List, Dict, Any
-from functools import partial
+from typing import Optional, Union, Type, List, Dict, Any, Mapping, Tuple
+from types import MappingProxyType
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 
 class ConfigValueError(ValueError):
@@ -122,16 +128,11 @@ class LanguageType(GlobalConfigType):
 
     @classmethod
     async def get_select_menu_values(cls, ctx: commands.Context) -> List[SelectOption]:
-        vals = get_langs_properties()
-        ret = []
-        for val in vals:
-            e = await ctx.bot.loop.run_in_executor(
-                None, partial(get_flag_emoji, val["flag_code"])
-            )
-            opt = SelectOption(label=val["name"], value=val["code"], emoji=e)
-            ret.append(opt)
-
-        return ret
+        # options are created every time because views change their default
+        return [
+            SelectOption(label=lang.name, value=lang.code, emoji=lang.flag_emoji or None)
+            for lang in get_langs_index()
+        ]
 
 
 # Guild only configurations
@@ -327,7 +328,59 @@ except ImportError:
 except Exception as e:
     get_logger().error("Could not load custom configurations.", exc_info=e)
 
+
+class ConfigSchema:
+    """
+    The configurations available for a kind of config.
+    Schemas are read-only and shared by every Config of that kind.
+    """
+
+    __slots__ = ("kind", "keys", "indexes", "types", "emojis", "base", "version")
+
+    def __init__(self, kind: str, types: List[Type[ConfigType]]):
+        by_key = {t.key: t for t in types}
+        self.kind = kind
+        self.keys: Tuple[str, ...] = tuple(by_key)
+        self.indexes: Mapping[str, int] = MappingProxyType(
+            {k: i for i, k in enumerate(self.keys)}
+        )
+        self.types: Mapping[str, Type[ConfigType]] = MappingProxyType(by_key)
+        self.emojis: Mapping[str, str] = MappingProxyType(
+            {k: t.emoji for k, t in by_key.items()}
+        )
+        self.base: Mapping[str, Any] = MappingProxyType(
+            {k: t.default for k, t in by_key.items()}
+        )
+        # entries storing this version already have every configuration
+        self.version = hashlib.sha1(",".join(self.keys).encode()).hexdigest()[:12]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} kind={self.kind!r} keys={self.keys!r}>"
+
+
+def build_config_schemas() -> Mapping[str, ConfigSchema]:
+    """Create the config schemas from the ConfigType subclasses."""
+    global_types = GlobalConfigType.__subclasses__()
+    return MappingProxyType(
+        {
+            "": ConfigSchema("", global_types),
+            "user": ConfigSchema("user", global_types + UserConfigType.__subclasses__()),
+            "guild": ConfigSchema(
+                "guild", global_types + GuildConfigType.__subclasses__()
+            ),
+        }
+    )
+
+
+# built after custom configurations are
+# loaded, so they're included as well
+CONFIG_SCHEMAS = build_config_schemas()
+
+
 class Config:
+    __slots__ = ("bot", "schema", "id", "_values", "_up_to_date")
+    kind: str = ""
+
     def __init__(
         self,
         bot,
@@ -337,50 +390,69 @@ class Config:
         from strapbot import StrapBot  # sorry but I like specifying types
 
         self.bot: StrapBot = bot
-        self._data: dict = data
-        self.types: Dict[str, Type[ConfigType]] = types or self._create_types()
-        self.emojis = {k: t.emoji for k, t in self.types.items()}
-        self.base: Dict[str, Any] = self._create_base()
+        self.schema: ConfigSchema = (
+            ConfigSchema(self.kind, list(types.values()))
+            if types
+            else CONFIG_SCHEMAS[self.kind]
+        )
         self.id = data["_id"]
-        self.db = self.bot.get_db("Configurations", cog=False)
+        self._load(data)
 
-    @staticmethod
-    def _create_types(
-        tp: Optional[Union[Type[GuildConfigType], Type[UserConfigType]]] = None
-    ) -> Dict[str, Type[ConfigType]]:
-        return {
-            t.key: t
-            for t in GlobalConfigType.__subclasses__()
-            + (tp.__subclasses__() if tp else [])
-        }
+    def _load(self, entry: dict):
+        # values are stored in the same order as the schema's keys,
+        # configurations that aren't in the entry yet are MISSING
+        self._values: Tuple[Any, ...] = tuple(
+            entry.get(k, MISSING) for k in self.schema.keys
+        )
+        self._up_to_date = entry.get("schema_version") == self.schema.version
 
-    def _create_base(self) -> Dict[str, Any]:
-        return {k: t.default for k, t in self.types.items()}
+    @property
+    def db(self):
+        return self.bot.get_db("Configurations", cog=False)
+
+    @property
+    def types(self) -> Mapping[str, Type[ConfigType]]:
+        return self.schema.types
+
+    @property
+    def emojis(self) -> Mapping[str, str]:
+        return self.schema.emojis
+
+    @property
+    def base(self) -> Mapping[str, Any]:
+        return self.schema.base
 
     @property
     def target(self) -> Union[discord.Guild, discord.User, None]:
         return self.bot.get_guild(self.id) or self.bot.get_user(self.id)
 
     @property
-    def data(self):
-        ret = self._data.copy()
-        ret.pop("id", ret.pop("_id", None))
-        typekeys = self.types.keys()
-        for k in ret.copy().keys():
-            if k not in typekeys:
-                ret.pop(k, None)
-
-        return ret
+    def data(self) -> Dict[str, Any]:
+        return {
+            k: v
+            for k, v in zip(self.schema.keys, self._values)
+            if v is not MISSING
+        }
 
     def __getitem__(self, item):
-        return self._data[item]
+        if item in ("_id", "id"):
+            return self.id
+
+        index = self.schema.indexes.get(item)
+        if index == None or self._values[index] is MISSING:
+            raise KeyError(item)
+
+        return self._values[index]
 
     def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+
         return self[item]
 
     def __repr__(self):
-        attrs = []
-        for k, v in self._data.items():
+        attrs = [f"_id={self.id!r}"]
+        for k, v in self.data.items():
             attrs.append(f"{k}={v!r}")
 
         args = " ".join(attrs)
@@ -388,21 +460,33 @@ class Config:
 
     async def fetch(self, update=False):
         """Update the entries to add new configurations."""
-        modified = False
-        entry = self._data.copy()
-        for k, v in self.base.items():
-            if k not in entry:
-                modified = True
-                entry[k] = self.types[k](v, self.bot)
-
-        if modified or update:
-            if modified:
-                await self.db.update_one({"_id": self.id}, {"$set": entry})  # type: ignore
-            self._data: dict = await self.db.find_one({"_id": self.id})  # type: ignore
-
-        self._data.pop("type", None)
-        # self.__data["id"] = self.__data.pop("_id", self.id)
-        return self._data
+        missing = {}
+        if not self._up_to_date:
+            missing = {
+                k: self.types[k](self.base[k], self.bot)
+                for k, v in zip(self.schema.keys, self._values)
+                if v is MISSING
+            }
+
+        if missing:
+            missing["schema_version"] = self.schema.version
+
+        entry = None
+        if missing:
+            # one round trip that both writes the new
+            # configurations and returns the whole entry
+            entry = await self.db.find_one_and_update(  # type: ignore
+                {"_id": self.id},
+                {"$set": missing},
+                return_document=ReturnDocument.AFTER,
+            )
+        elif update:
+            entry = await self.db.find_one({"_id": self.id})  # type: ignore
+
+        if entry != None:
+            self._load(entry)
+
+        return self.data
 
     @classmethod
     async def create_config(
@@ -411,13 +495,27 @@ class Config:
         """Create a config class"""
         if not target:
             raise Exception
+
+        kind = type(target).__name__.lower()
+        schema = CONFIG_SCHEMAS["guild" if kind == "guild" else "user"]
+        defaults = {k: t(t.default, bot) for k, t in schema.types.items()}
+        defaults["type"] = kind
+        defaults["schema_version"] = schema.version
+
+        # new entries are created with their defaults in the same
+        # round trip, existing ones are just returned as they are
         db = bot.get_db("Configurations", cog=False)
-        entry = await db.find_one({"_id": target.id})
-        if not entry:
-            entry = {}
-            entry["_id"] = target.id
-            entry["type"] = type(target).__name__.lower()
-            await db.insert_one(entry)
+        query = {"_id": target.id}
+        update = {"$setOnInsert": defaults}
+        try:
+            entry = await db.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # another upsert for the same target won the race
+            entry = await db.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
 
         if entry["type"] == "user":
             cls = UserConfig
@@ -430,32 +528,153 @@ class Config:
         return ret
 
     async def set(self, **props):
-        new = self._data.copy()
-        new["type"] = type(self.target).__name__.lower()
-        modified = False
+        new = {}
         for key, value in props.items():
             if key not in self.types:
                 raise KeyError(key)
 
             new[key] = self.types[key](value, self.bot)
-            modified = True
 
-        ret = new.copy()
-        if modified:
-            await self.db.update_one({"_id": self.id}, {"$set": new})  # type: ignore
-            ret = await self.fetch(True)
+        if not new:
+            return self.data
+
+        new["type"] = self.kind
+        # the updated entry is returned by the same request
+        entry = await self.db.find_one_and_update(  # type: ignore
+            {"_id": self.id},
+            {"$set": new},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._load(entry)
+        ret = await self.fetch()
+        # write-through, so the cached entry is refreshed too
+        self.bot.config_cache.put(self)
 
         return ret
 
 
+async def migrate_configs(bot) -> Dict[str, int]:
+    """
+    Add the default values of missing configurations to every outdated
+    entry and mark it with the current schema version, with a single
+    update_many per kind, so `Config.fetch` doesn't need to check them
+    anymore. Returns how many entries have been modified for each kind.
+    """
+    db = bot.get_db("Configurations", cog=False)
+    ret: Dict[str, int] = {}
+    for kind in ("user", "guild"):
+        schema = CONFIG_SCHEMAS[kind]
+        values: Dict[str, Any] = {}
+        for key, tp in schema.types.items():
+            # only missing values are replaced, even null ones are kept
+            default = {"$literal": tp(schema.base[key], bot)}
+            is_missing = {"$eq": [{"$type": f"${key}"}, "missing"]}
+            values[key] = {"$cond": [is_missing, default, f"${key}"]}
+
+        values["schema_version"] = schema.version
+        result = await db.update_many(
+            {"type": kind, "schema_version": {"$ne": schema.version}},
+            [{"$set": values}],
+        )
+        ret[kind] = result.modified_count
+
+    return ret
+
+
 class UserConfig(Config):
-    def __init__(self, bot, **data):
-        super().__init__(bot, self._create_types(UserConfigType), **data)
+    __slots__ = ()
+    kind = "user"
 
 
 class GuildConfig(Config):
-    def __init__(self, bot, **data):
-        super().__init__(bot, self._create_types(GuildConfigType), **data)
+    __slots__ = ()
+    kind = "guild"
 
 
 AnyConfig = Union[UserConfig, GuildConfig, Config]
+
+
+class ConfigCache:
+    """
+    A bounded LRU cache for configs, with a separate limit for
+    users and guilds. Entries older than `ttl` seconds are dropped
+    when accessed, so changes made by the server or other shards
+    are eventually seen. A `ttl` of 0 disables expiration.
+    """
+
+    def __init__(
+        self,
+        max_users: Optional[int] = None,
+        max_guilds: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        if max_users == None:
+            max_users = int(os.getenv("CONFIG_CACHE_MAX_USERS") or 10000)
+        if max_guilds == None:
+            max_guilds = int(os.getenv("CONFIG_CACHE_MAX_GUILDS") or 2000)
+        if ttl == None:
+            ttl = float(os.getenv("CONFIG_CACHE_TTL") or 600)
+
+        self.limits = {"user": max_users, "guild": max_guilds}
+        self.ttl = ttl
+        self._entries: Dict[str, "OrderedDict[int, tuple]"] = {
+            kind: OrderedDict() for kind in self.limits
+        }
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return sum(len(e) for e in self._entries.values())
+
+    def __contains__(self, id: int):
+        return any(id in e for e in self._entries.values())
+
+    def get(self, id: int) -> Optional[AnyConfig]:
+        """Get a cached config, or None if it's missing or expired."""
+        for entries in self._entries.values():
+            if id not in entries:
+                continue
+
+            stored_at, config = entries[id]
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del entries[id]
+                self.expirations += 1
+                break
+
+            entries.move_to_end(id)
+            self.hits += 1
+            return config
+
+        self.misses += 1
+
+    def put(self, config: AnyConfig):
+        """Add or refresh a config, evicting the least recently used ones if needed."""
+        kind = "guild" if isinstance(config, GuildConfig) else "user"
+        entries = self._entries[kind]
+        entries[config.id] = (time.monotonic(), config)
+        entries.move_to_end(config.id)
+        while len(entries) > max(self.limits[kind], 0):
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, id: Optional[int] = None):
+        """Remove a config from the cache, or every config if no ID is given."""
+        for entries in self._entries.values():
+            if id == None:
+                entries.clear()
+            else:
+                entries.pop(id, None)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._entries["user"]),
+            "guilds": len(self._entries["guild"]),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
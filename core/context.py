@@ -1,12 +1,12 @@
 import typing
 import os
+import asyncio
 import discord
 import json
 from discord.ext import commands
 from discord.ext.commands.view import StringView
 from discord.ext.commands.context import DeferTyping as OriginalDeferTyping
 from .utils import get_lang
-from typing_extensions import Self
 from discord.utils import MISSING
 from .config import GuildConfig, UserConfig
 from discord.context_managers import Typing
@@ -22,9 +22,6 @@ class DeferTyping(OriginalDeferTyping):
 
 
 class StrapContext(commands.Context):
-    __user_config: UserConfig = MISSING
-    __guild_config: GuildConfig = MISSING
-
     def __init__(
         self,
         user_config: UserConfig = MISSING,
@@ -66,25 +63,40 @@ class StrapContext(commands.Context):
         from strapbot import StrapBot
 
         self.bot: StrapBot = bot  # type: ignore
-        if (user_config is MISSING and self.__user_config is MISSING) or (
-            guild_config is MISSING and self.__guild_config is MISSING
-        ):
-            raise Exception("StrapContext must have both user and guild configs")
-        else:
-            if user_config is not MISSING:
-                self.__user_config = user_config
-
-            if guild_config is not MISSING:
-                self.__guild_config = guild_config
-
-    @classmethod
-    def configure(
-        cls, user_config: UserConfig, guild_config: GuildConfig
-    ) -> typing.Type[Self]:
-        cls.__user_config = user_config
-        cls.__guild_config = guild_config
-
-        return cls
+        # configs are stored per instance, so concurrent
+        # contexts never see each other's settings
+        self.__user_config = user_config
+        self.__guild_config = guild_config
+
+    async def load_configs(self):
+        """
+        Load the user and guild configs if they haven't been loaded yet.
+        Contexts created by the bot get this awaited for them, either
+        right away or, with lazy configs, once a command is found.
+        """
+        tasks = {}
+        if self.__user_config is MISSING:
+            tasks["user"] = self.bot.get_config(self.author)
+
+        if self.__guild_config is MISSING and self.guild:
+            tasks["guild"] = self.bot.get_config(self.guild)
+
+        results = dict(zip(tasks.keys(), await asyncio.gather(*tasks.values())))
+        if "user" in results:
+            self.__user_config = results["user"]  # type: ignore
+
+        if "guild" in results:
+            self.__guild_config = results["guild"]  # type: ignore
+
+    def _get_loaded_config(self, config, target) -> typing.Any:
+        if config is MISSING:
+            config = self.bot.get_cached_config(target.id) if target else None
+            if config == None:
+                raise RuntimeError(
+                    "configs have not been loaded yet, await load_configs() first"
+                )
+
+        return config
 
     @property
     def config(self) -> UserConfig:
@@ -94,11 +106,13 @@ class StrapContext(commands.Context):
     @property
     def user_config(self) -> UserConfig:
         """The current user's settings"""
+        self.__user_config = self._get_loaded_config(self.__user_config, self.author)
         return self.__user_config
 
     @property
     def guild_config(self) -> GuildConfig:
         """The current guild's settings."""
+        self.__guild_config = self._get_loaded_config(self.__guild_config, self.guild)
         return self.__guild_config
 
     @property
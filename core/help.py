@@ -1,12 +1,11 @@
 import os
 import typing
-import json
 import discord
 from discord import ui
 from discord.ext import commands
 from discord.interactions import Interaction
 from .context import StrapContext
-from .utils import get_lang, LANGS_PATH, DEFAULT_LANG_ENV
+from .utils import get_lang, LANG_CATALOG, DEFAULT_LANG_ENV
 
 # for some reason I want to put help views
 # here instead of the views folder
@@ -102,37 +101,27 @@ class StrapBotHelp(commands.HelpCommand):
     def lang(self):
         return get_lang(self.context.language_to_use, cog=self.cog, command=self)
 
-    def _get_cog_path(
-        self, cog: commands.Cog, lang: typing.Optional[str] = None
-    ) -> str:
-        p = os.path.abspath("./langs")
-        cname = type(cog).__name__
-        return os.path.join(p, lang or self.context.language_to_use, "cogs", cname)
-
-    def _get_cog_lang_file(self, cog: commands.Cog, path: str) -> str:
-        fp = os.path.join(self._get_cog_path(cog), path)
-        if not os.path.exists(fp):
-            deflang = os.getenv(DEFAULT_LANG_ENV, "en")
-            fp = os.path.join(self._get_cog_path(cog, deflang), path)
+    def _get_cog_lang_file(self, cog: commands.Cog, file: str) -> tuple:
+        """Get the catalog key of a cog's file, falling back to the default language."""
+        key = ("cogs", type(cog).__name__, file)
+        lang = self.context.language_to_use
+        if not LANG_CATALOG.exists(lang, *key):
+            lang = os.getenv(DEFAULT_LANG_ENV, "en")
 
-        return fp
+        return (lang, *key)
 
     def get_cog_name(self, cog: commands.Cog) -> str:
-        fp = self._get_cog_lang_file(cog, "__data__.json")
-        if not os.path.exists(fp):
+        data = LANG_CATALOG.get(*self._get_cog_lang_file(cog, "__data__.json"))
+        if data == None:
             return cog.__cog_name__
 
-        data = json.load(open(fp))
         return data["name"]
 
     def get_cog_description(self, cog: commands.Cog) -> str:
-        fp = self._get_cog_lang_file(cog, "__description__.md")
-        if not os.path.exists(fp):
+        ret = LANG_CATALOG.get_text(*self._get_cog_lang_file(cog, "__description__.md"))
+        if ret == None:
             return cog.__cog_description__
 
-        f = open(fp)
-        ret = f.read()
-        f.close()
         return ret
 
     def _get_help_text(self):
@@ -151,20 +140,16 @@ class StrapBotHelp(commands.HelpCommand):
         my_guild = self.context.format_message(
             "my_server", {"my_guild": "https://discord.gg/G4de45Bywg"}, lang=self.lang
         )
-        path = f"langs/{self.context.language_to_use}/help.md"
-        if not os.path.exists(path):
+        text = LANG_CATALOG.get_text(self.context.language_to_use, "help.md")
+        if text == None:
             deflang = os.getenv(DEFAULT_LANG_ENV, "en")
-            path = f"langs/{deflang}/help.md"
+            text = LANG_CATALOG.get_text(deflang, "help.md") or ""
 
-        ret = (
-            open(path)
-            .read()
-            .format(
-                bot_name=self.context.me.name,
-                maybe_based_on_sb=basedonsb,
-                invite_link=invite_link,
-                maybe_my_server=my_guild,
-            )
+        ret = text.format(
+            bot_name=self.context.me.name,
+            maybe_based_on_sb=basedonsb,
+            invite_link=invite_link,
+            maybe_my_server=my_guild,
         )
         return ret.strip()
 
@@ -354,16 +339,11 @@ class StrapBotHelp(commands.HelpCommand):
         }
         lang = self.context.language_to_use
         default_lang = os.getenv(DEFAULT_LANG_ENV, "en")
-        lpaths = [
-            os.path.join(LANGS_PATH, lang),
-            os.path.join(LANGS_PATH, default_lang),
-        ]
-        for d in lpaths:
-            path = os.path.join(LANGS_PATH, d, "cogs", cog_name, "__data__.json")
-            if not os.path.exists(path):
+        for l in (lang, default_lang):
+            data = LANG_CATALOG.get(l, "cogs", cog_name, "__data__.json")
+            if data == None:
                 continue
 
-            data = json.load(open(path))
             name = data["name"]
             names[name] = cog
             names[name.split()[0]] = cog
@@ -8,7 +8,8 @@ import logging
 import asyncio
 import unicodedata
 from rich.logging import RichHandler
-from typing import Dict, List, Optional, Union
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
 from pyfiglet import Figlet
 from discord.ext import commands
 from datetime import timedelta
@@ -33,7 +34,6 @@ from discord.ext.commands import (
 )
 from discord.ext.commands.hybrid import HybridAppCommand
 from discord.enums import Locale
-from functools import partial
 
 AnyCommand = Union[
     Command,
@@ -147,20 +147,110 @@ def get_logger(name: str = ""):
 # Languages
 
 
-def get_langs() -> List[str]:
-    ret = []
-    f = lambda d: os.path.isdir(os.path.join(LANGS_PATH, d))
-    for d in filter(f, os.listdir(LANGS_PATH)):
-        datapath = os.path.join(LANGS_PATH, d, "__data__.json")
-        if os.path.exists(datapath):
-            data = json.load(open(datapath))
-            ret.append(data["code"])
+class LanguageInfo(NamedTuple):
+    """A language's properties, with its flag emoji already computed."""
 
-    return ret
+    code: str
+    name: str
+    flag_emoji: str
+    properties: Mapping[str, Any]
+
+
+class LanguageCatalog:
+    """
+    In-memory copy of every translation in the langs folder.
+
+    All the files are read once by `load`, then translations
+    are looked up by their path relative to the langs folder,
+    e.g. `("en", "cogs", "Utilities", "ping.json")`.
+    Call `load` again to pick up changes made to the files.
+    """
+
+    def __init__(self, path: str = LANGS_PATH):
+        self.path = path
+        self.loaded = False
+        self.langs: Dict[str, dict] = {}
+        self.codes: frozenset = frozenset()
+        self.index: Tuple[LanguageInfo, ...] = ()
+        self.files: Dict[Tuple[str, ...], dict] = {}
+        self.texts: Dict[Tuple[str, ...], str] = {}
+
+    def load(self):
+        """(Re)load all the translations from the disk."""
+        files: Dict[Tuple[str, ...], dict] = {}
+        texts: Dict[Tuple[str, ...], str] = {}
+        for root, dirs, filenames in os.walk(self.path):
+            # skip .git, .github and such
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            rel = os.path.relpath(root, self.path)
+            parts = tuple(rel.split(os.sep)) if rel != os.curdir else ()
+            for filename in filenames:
+                fp = os.path.join(root, filename)
+                ext = os.path.splitext(filename)[1]
+                if ext == ".json":
+                    with open(fp) as f:
+                        files[parts + (filename,)] = json.load(f)
+                elif ext == ".md":
+                    with open(fp) as f:
+                        texts[parts + (filename,)] = f.read()
+
+        langs = {
+            key[0]: data
+            for key, data in sorted(files.items())
+            if len(key) == 2 and key[1] == "__data__.json"
+        }
+
+        self.files = files
+        self.texts = texts
+        self.langs = langs
+        self.codes = frozenset(data["code"] for data in langs.values())
+        self.index = tuple(
+            LanguageInfo(
+                data["code"],
+                data.get("name", data["code"]),
+                get_flag_emoji(data["flag_code"]) if data.get("flag_code") else "",
+                MappingProxyType(data),
+            )
+            for data in langs.values()
+        )
+        self.loaded = True
+        return self
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def get(self, *key: str) -> Optional[dict]:
+        """
+        Get the content of a JSON file.
+        A shallow copy is returned, so callers can pop keys from it.
+        """
+        self._ensure_loaded()
+        data = self.files.get(key)
+        return dict(data) if data != None else None
+
+    def get_text(self, *key: str) -> Optional[str]:
+        """Get the content of a Markdown file."""
+        self._ensure_loaded()
+        return self.texts.get(key)
+
+    def exists(self, *key: str) -> bool:
+        self._ensure_loaded()
+        return key in self.files or key in self.texts
+
+
+LANG_CATALOG = LanguageCatalog()
+
+
+def get_langs_index() -> Tuple[LanguageInfo, ...]:
+    """Get the properties of every language, in the order they were loaded."""
+    LANG_CATALOG._ensure_loaded()
+    return LANG_CATALOG.index
 
 
 def lang_exists(lang: str):
-    return lang in get_langs()
+    LANG_CATALOG._ensure_loaded()
+    return lang in LANG_CATALOG.codes
 
 
 def try_lang(lang: str) -> str:
@@ -170,8 +260,8 @@ def try_lang(lang: str) -> str:
     return lang
 
 
-def get_lang_command_file_path(lang: str, command: Union[AnyCommand, AnyGroup]) -> str:
-    """Get the file path of a command's translations, without checking anything."""
+def get_command_lang_parts(command: Union[AnyCommand, AnyGroup]) -> Tuple[str, ...]:
+    """Get the path of a command's translations inside a language folder, without the extension."""
     cog = getattr(command, "cog", getattr(command, "binding", None))
     cog_name = type(cog).__name__ if cog != None else None
     if isinstance(command, HelpCommand):
@@ -181,54 +271,39 @@ def get_lang_command_file_path(lang: str, command: Union[AnyCommand, AnyGroup])
 
     # "commands" is for commands without a cog,
     # which is unlikely going to happen anyway
-    fp = os.path.join(
-        LANGS_PATH,
-        lang,
-        os.path.join("cogs", cog_name) if cog_name != None else "commands",
-    )
+    parts = ["cogs", cog_name] if cog_name != None else ["commands"]
     parent: Optional[AnyGroup] = getattr(command, "parent", None)
     parents: List[str] = []
     while parent != None:
         parents.append(parent.name)
         parent = parent.parent  # type: ignore
 
-    fp = os.path.join(os.path.join(fp, *reversed(parents)), command_name)
-
-    # I wanted to make something long
-    if (
-        os.path.isdir(fp) and os.path.exists(os.path.join(fp, "__data__.json"))
-    ) or isinstance(command, Group):
-        return os.path.join(fp, "__data__.json")
-    else:
-        return f"{fp}.json"
+    parts.extend(reversed(parents))
+    parts.append(command_name)
+    return tuple(parts)
 
 
-def get_command_lang_file(
+def get_command_lang(
     lang: str, command: Union[AnyCommand, AnyGroup]
-) -> Optional[str]:
-    """Get the file path of a command's translations. Returns None if a check fails."""
-    lang = try_lang(lang)
-
-    ret = get_lang_command_file_path(lang, command)
-    if os.path.exists(ret):
-        return ret
-    else:
-        lang = os.getenv(DEFAULT_LANG_ENV, "en")
-        ret = get_lang_command_file_path(lang, command)
-        if os.path.exists(ret):
+) -> Optional[dict]:
+    """Get a command's translations, falling back to the default language."""
+    *parents, name = get_command_lang_parts(command)
+    for l in (try_lang(lang), os.getenv(DEFAULT_LANG_ENV, "en")):
+        ret = LANG_CATALOG.get(l, *parents, name, "__data__.json")
+        if ret == None and not isinstance(command, Group):
+            ret = LANG_CATALOG.get(l, *parents, f"{name}.json")
+
+        if ret != None:
             return ret
 
 
 def get_lang_properties_file(lang: str, file: str) -> Optional[dict]:
     lang = try_lang(lang)
 
-    path = lambda l: os.path.join(LANGS_PATH, l, file)
-    if not os.path.exists(path(lang)):
+    if not LANG_CATALOG.exists(lang, file):
         lang = os.getenv(DEFAULT_LANG_ENV, "en")
-        if not os.path.exists(path(lang)):
-            return
 
-    return json.load(open(path(lang)))
+    return LANG_CATALOG.get(lang, file)
 
 
 def get_lang_properties(lang: str) -> Optional[dict]:
@@ -236,7 +311,7 @@ def get_lang_properties(lang: str) -> Optional[dict]:
 
 
 def get_langs_properties() -> List[dict]:
-    return [get_lang_properties(lang) for lang in get_langs()]  # type: ignore
+    return [dict(lang.properties) for lang in get_langs_index()]
 
 
 def get_lang_config_names(lang: str) -> Optional[dict]:
@@ -251,42 +326,28 @@ def get_lang(
 ) -> Optional[dict]:
     lang = try_lang(lang)
 
-    fp = os.path.join(LANGS_PATH, lang)
     if isinstance(command, Choice):
-        fp = os.path.join(fp, "choices.json")
-    else:
-        command_cog = getattr(command, "cog", getattr(command, "binding", None))
-        if (cog != None and command != None) and (type(command_cog) != type(cog)):
-            raise ValueError("You can't give a command from a different cog.")
+        return LANG_CATALOG.get(lang, "choices.json")
 
-        if cog == None and command == None:
-            raise ValueError("Either cog or command must be given.")
+    command_cog = getattr(command, "cog", getattr(command, "binding", None))
+    if (cog != None and command != None) and (type(command_cog) != type(cog)):
+        raise ValueError("You can't give a command from a different cog.")
 
-        cog = cog or command_cog  # type: ignore # At least one of the twos must not be None
+    if cog == None and command == None:
+        raise ValueError("Either cog or command must be given.")
 
-        if cog != None and command == None:
-            fp = os.path.join(
-                fp,
-                "cogs",
-                type(cog).__name__,
-                f"__data__.json",
-            )
-        elif command != None:
-            fp = get_command_lang_file(lang, command)
-            if fp == None:
-                return
+    cog = cog or command_cog  # type: ignore # At least one of the twos must not be None
 
-    if not os.path.exists(fp):
-        return
+    if command != None:
+        return get_command_lang(lang, command)
 
-    return json.load(open(fp))
+    return LANG_CATALOG.get(lang, "cogs", type(cog).__name__, "__data__.json")
 
 
 class MyTranslator(Translator):
     async def translate(
         self, string: locale_str, locale: Locale, context: TranslationContextTypes
     ) -> Optional[str]:
-        loop = asyncio.get_event_loop()
         # country-specific locales haven't been implemented yet
         lang = locale.value.split("-")[0]
 
@@ -297,15 +358,13 @@ class MyTranslator(Translator):
         command = context.data
         if isinstance(context.data, Parameter):
             command = context.data.command
-        props = await loop.run_in_executor(
-            None, partial(get_lang, lang, command=command)  #  type: ignore
-        )
+        props = get_lang(lang, command=command)  #  type: ignore
         props_check = lambda: props == None or (
             isinstance(command, Choice) and command.name not in props
         )
         if props == None or props_check():
             default = os.getenv(DEFAULT_LANG_ENV, "en")
-            props = await loop.run_in_executor(None, partial(get_lang, default, command=command))  # type: ignore
+            props = get_lang(default, command=command)  # type: ignore
             if props == None or props_check():
                 return
 
@@ -363,21 +422,6 @@ def paginate_list(lst: list, items: int):
     return [lst[i : i + items] for i in range(0, len(lst), items)]
 
 
-def get_guild_youtube_channels(
-    channels: List[Dict[str, Union[str, List[str]]]], guild_data: dict
-):
-    """
-    channels must be the full list of channels in the YouTubeNews DB
-    guild_data must be the guild entry in the YouTubeNewsGuilds DB
-    """
-    ret = guild_data.copy()
-    ret["channels"] = []
-    for item in channels:
-        if guild_data["_id"] in item["guilds"]:
-            ret["channels"].append(item["data"])
-    return ret
-
-
 def get_flag_emoji(code):
     """Returns a flag emoji, given a country code"""
     ret = ""
@@ -1,22 +1,106 @@
+import asyncio
 import discord
 import os
+import re
+import time
 import typing
 from aiohttp import ClientResponse, ClientResponseError, RequestInfo
 from aiohttp.typedefs import LooseHeaders
+from collections import OrderedDict
 from ..context import StrapContext
 from datetime import datetime, timedelta
 from discord import ui, Interaction, ButtonStyle
 from enum import Enum
+from pymongo import ReturnDocument
 from typing import Optional, Tuple
 from urllib.parse import urlencode
 from . import View, Modal, PaginationView, StopButton
-from ..utils import get_guild_youtube_channels, paginate_list
+from ..utils import paginate_list, get_logger
+
+logger = get_logger(__name__)
 
 
 class SearchType(Enum):
     channels = 0
     id = -1
     search = 1
+    handle = -2
+
+
+# results are reused for 12 hours, since channels don't change often
+# and YouTube APIs are very slow most of times
+SEARCH_CACHE_TTL = timedelta(hours=12)
+SEARCH_CACHE_SIZE = 1000
+CHANNEL_URL_RE = re.compile(
+    r"^(?:https?://)?(?:www\.|m\.)?youtube\.com/"
+    r"(?:channel/(?P<id>UC[\w-]{22})|@(?P<handle>[\w.-]+)|user/(?P<username>[\w.-]+))",
+    re.IGNORECASE,
+)
+CHANNEL_ID_RE = re.compile(r"^UC[\w-]{22}$")
+# usernames and handles are single words
+CHANNEL_NAME_RE = re.compile(r"^[\w.-]+$")
+# units of the YouTube Data API quota used by each request
+SEARCH_QUOTA_COSTS = {SearchType.search: 100}
+
+
+class SearchCache:
+    """
+    An in-process LRU cache of simplified search results, in
+    front of the Cache collection. Only results are cached here,
+    so empty searches are always tried again.
+    """
+
+    def __init__(
+        self, max_size: int = SEARCH_CACHE_SIZE, ttl: timedelta = SEARCH_CACHE_TTL
+    ):
+        self.max_size = max_size
+        self.ttl = ttl.total_seconds()
+        self._entries: "OrderedDict[str, Tuple[float, typing.List[dict]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: str) -> Optional[typing.List[dict]]:
+        if key not in self._entries:
+            return None
+
+        stored_at, results = self._entries[key]
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return list(results)
+
+    def put(self, key: str, results: typing.List[dict], age: float = 0):
+        self._entries[key] = (time.monotonic() - age, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+SEARCH_CACHE = SearchCache()
+
+
+def normalize_query(query: str) -> Tuple[Optional[SearchType], str]:
+    """
+    Normalize a search query, returning the type of search it needs if
+    it's a channel URL, ID or handle. Channel IDs are case sensitive, everything else
+    is compared case insensitively by YouTube.
+    """
+    query = " ".join(query.split())
+    match = CHANNEL_URL_RE.match(query)
+    if match and match["id"]:
+        return (SearchType.id, match["id"])
+    elif match and match["handle"]:
+        return (SearchType.handle, "@" + match["handle"].casefold())
+    elif match and match["username"]:
+        return (SearchType.channels, match["username"].casefold())
+    elif CHANNEL_ID_RE.match(query):
+        return (SearchType.id, query)
+    elif query.startswith("@") and " " not in query:
+        return (SearchType.handle, query.casefold())
+
+    return (None, query.casefold())
 
 
 class BackButton(StopButton):
@@ -101,6 +185,41 @@ class ChannelsPaginator(PaginationView):
 
         return ret
 
+    async def update_guilds(
+        self, youtuber: dict, guild_id: int, subscribe: bool
+    ) -> Optional[int]:
+        """
+        Add or remove a guild from the guilds of a YouTube channel and
+        return how many guilds it has now, or None if it was already added.
+        """
+        db = self.ctx.bot.get_db("YouTubeNews", False)
+        if subscribe:
+            before = await db.find_one_and_update(
+                {"_id": youtuber["id"]},
+                {"$addToSet": {"guilds": guild_id}, "$set": {"data": youtuber}},
+                projection={
+                    "added": {"$in": [guild_id, "$guilds"]},
+                    "count": {"$size": "$guilds"},
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )  #  type: ignore
+            if before == None:
+                return 1
+            elif before["added"]:
+                return None
+
+            return before["count"] + 1
+
+        after = await db.find_one_and_update(
+            {"_id": youtuber["id"], "guilds": guild_id},
+            {"$pull": {"guilds": guild_id}},
+            projection={"count": {"$size": "$guilds"}},
+            return_document=ReturnDocument.AFTER,
+        )  #  type: ignore
+        # -1 means the guild was already removed, nothing to tell the hub
+        return after["count"] if after != None else -1
+
     @ui.button(custom_id="choose", label="btn_choose", style=discord.ButtonStyle.green)
     async def choose(self, interaction: Interaction, button: ui.Button):
         await interaction.response.defer()
@@ -112,11 +231,9 @@ class ChannelsPaginator(PaginationView):
 
         try:
             db = self.ctx.bot.get_db("YouTubeNews", False)
-            channel_db = (
-                await db.find_one({"_id": youtuber["id"]})  #  type: ignore
-            ) or {"guilds": []}
-
-            if subscribe and channel.guild.id in channel_db["guilds"]:
+            guild_id = channel.guild.id
+            count = await self.update_guilds(youtuber, guild_id, subscribe)
+            if count == None:
                 await interaction.followup.edit_message(
                     interaction.message.id,  #  type: ignore
                     content=self.ctx.format_message("already_added"),
@@ -125,24 +242,18 @@ class ChannelsPaginator(PaginationView):
                 )
                 return
 
-            f = channel_db["guilds"].append
-            if not subscribe:
-                f = channel_db["guilds"].remove
-
-            f(channel.guild.id)
-
-            # convert guilds to a set to avoid duplicates,
-            # then converting it back to list
-            channel_db["guilds"] = list(set(channel_db["guilds"]))
-            channel_db["data"] = youtuber
-
-            guilds_check = bool(channel_db["guilds"])
-            await self.ctx.bot.request_pubsubhubbub(
-                youtuber["id"], subscribe or guilds_check
-            )
-            await db.update_one(
-                {"_id": youtuber["id"]}, {"$set": channel_db}, upsert=True
-            )  #  type: ignore
+            # the hub only needs to know about the
+            # first guild added and the last one removed
+            if count == int(subscribe):
+                try:
+                    await self.ctx.bot.request_pubsubhubbub(youtuber["id"], subscribe)
+                except Exception:
+                    # undo the change, so the guild can try again
+                    op = "$pull" if subscribe else "$addToSet"
+                    await db.update_one(
+                        {"_id": youtuber["id"]}, {op: {"guilds": guild_id}}
+                    )  #  type: ignore
+                    raise
 
         except Exception as e:
             await interaction.followup.edit_message(
@@ -184,13 +295,14 @@ class AddChannelModal(Modal):
         super().__init__(view.ctx, title="add_modal_title")
         self.view = view
         self.ctx = view.ctx
+        self.quota_used = 0
 
     def create_link(self, type: SearchType, query: str) -> str:
-        id = type == SearchType.id
-        type = SearchType.channels if id else type
         keys = {
             SearchType.search: "q",
-            SearchType.channels: "id" if id else "forUsername",
+            SearchType.channels: "forUsername",
+            SearchType.id: "id",
+            SearchType.handle: "forHandle",
         }
         args = {
             "key": os.getenv("GOOGLE_API_KEY"),
@@ -200,6 +312,8 @@ class AddChannelModal(Modal):
         }
         if type == SearchType.search:
             args["type"] = "channel"
+        else:
+            type = SearchType.channels
 
         return f"{self.BASE_LINK}/{type.name}?{urlencode(args)}"
 
@@ -230,49 +344,79 @@ class AddChannelModal(Modal):
     async def do_search_channels(
         self, query: str, *, type: SearchType = SearchType.channels
     ) -> typing.List[dict]:
-        query = query.strip()
-        db = self.ctx.bot.get_db("Cache", cog=False)
+        key = f"{type.name}:{query}"
+        ret = SEARCH_CACHE.get(key)
+        if ret != None:
+            return ret
 
-        cache = await db.find_one({"query": query}) or {}  # type: ignore
+        db = self.ctx.bot.get_db("Cache", cog=False)
+        cache = await db.find_one({"query": key}) or {}  # type: ignore
         link = self.create_link(type, query)
         ret = []
 
         used_at = cache.get("used_at", datetime.utcnow() - timedelta(hours=13))
-        if datetime.utcnow() < used_at + timedelta(hours=12) and self.simplify_results(
-            cache.get("body", {})
-        ):
+        if datetime.utcnow() < used_at + SEARCH_CACHE_TTL and cache.get("results"):
             # if less than 12 hours have passed since last time
             # and there are results in the cached data, then it
             # is useless to make another request, because data
-            # is most likely the same. also, YouTube APIs are
-            # very slow most of times.
-            return self.simplify_results(cache["body"])
+            # is most likely the same.
+            age = (datetime.utcnow() - used_at).total_seconds()
+            SEARCH_CACHE.put(key, cache["results"], age)
+            return cache["results"]
 
-        headers = {"If-None-Match": cache.get("body", {}).get("etag", "")}
+        headers = {"If-None-Match": cache.get("etag", "")}
+        self.quota_used += SEARCH_QUOTA_COSTS.get(type, 1)
 
         async with self.ctx.bot.session.get(link, headers=headers) as response:
             if response.status == 304:
-                await db.update_one({"query": query}, {"$set": {"used_at": datetime.utcnow()}})  # type: ignore
-                ret = self.simplify_results(cache["body"])
+                await db.update_one({"query": key}, {"$set": {"used_at": datetime.utcnow()}})  # type: ignore
+                ret = cache.get("results", [])
             else:
                 body = await response.json()
-                page_info = body.pop("pageInfo", {})
-                body["items"] = body.get("items", [])
+                page_info = body.get("pageInfo", {})
+                if page_info.get("totalResults", None):
+                    ret = self.simplify_results({"items": body.get("items", [])})
 
-                await db.update_one({"query": query}, {"$set": {"used_at": datetime.utcnow(), "body": body}}, upsert=True)  # type: ignore
+                # results are stored already simplified
+                await db.update_one({"query": key}, {"$set": {"used_at": datetime.utcnow(), "etag": body.get("etag", ""), "results": ret}}, upsert=True)  # type: ignore
 
-                if page_info.get("totalResults", None):
-                    ret = self.simplify_results(body)
+        if ret:
+            SEARCH_CACHE.put(key, ret)
 
         return ret
 
     async def search_channels(self, query: str) -> typing.List[dict]:
+        """
+        Find the channels matching a query, trying first the lookups
+        that fit it. Searches cost 100 times more quota than the other
+        lookups, so they're used only when nothing else is found.
+        """
+        self.quota_used = 0
+        type, query = normalize_query(query)
         ret = []
-        for name, type in SearchType.__members__.items():
-            ret = await self.do_search_channels(query, type=type)  # type: ignore
-            if ret:
-                break
+        if type != None:
+            ret = await self.do_search_channels(query, type=type)
+        elif CHANNEL_NAME_RE.match(query):
+            # a single word could be either a handle or a legacy username
+            results = await asyncio.gather(
+                self.do_search_channels(f"@{query}", type=SearchType.handle),
+                self.do_search_channels(query, type=SearchType.channels),
+            )
+            ids = set()
+            for item in results[0] + results[1]:
+                if item["id"] not in ids:
+                    ids.add(item["id"])
+                    ret.append(item)
+
+        # channel IDs can only be looked up
+        if not ret and type != SearchType.id:
+            ret = await self.do_search_channels(
+                query.lstrip("@"), type=SearchType.search
+            )
 
+        logger.debug(
+            f"Found {len(ret)} channels for {query!r} using {self.quota_used} quota units."
+        )
         return ret
 
     async def on_submit(self, interaction: Interaction, /) -> None:
@@ -306,10 +450,18 @@ class YouTubeView(View):
     def content(self):
         return self.ctx.format_message(self.__content, self.format)
 
+    async def get_guild_channels(self, guild_id: int) -> typing.List[dict]:
+        """Get the YouTube channels a guild is subscribed to."""
+        # this uses the multikey index on guilds, so
+        # only the guild's channels are read and sent
+        chdb = self.ctx.bot.get_db("YouTubeNews", False)
+        cursor = chdb.find({"guilds": guild_id}, {"data": 1})
+        return [item["data"] for item in await cursor.to_list(None)]
+
     async def interaction_check(self, interaction: Interaction, /) -> bool:
         return (
             interaction.user.id == self.ctx.author.id
-            and await self.ctx.bot.check_youtube_news()
+            and self.ctx.bot.youtube_news_available
         )
 
     @ui.button(label="btn_add", style=ButtonStyle.primary)
@@ -319,12 +471,8 @@ class YouTubeView(View):
     @ui.button(label="btn_list", style=ButtonStyle.primary)
     async def list_channels(self, interaction: Interaction, button: ui.Button):
         await interaction.response.defer()
-        chdb = self.ctx.bot.get_db("YouTubeNews", False)
-        gddb = self.ctx.bot.get_db("YouTubeNewsGuilds", False)
-        channels = await chdb.find().to_list(None)
-        guild_data = await gddb.find_one({"_id": interaction.guild_id})  # type: ignore
-        data = get_guild_youtube_channels(channels, guild_data)
-        if not data["channels"]:
+        channels = await self.get_guild_channels(interaction.guild_id)  # type: ignore
+        if not channels:
             await interaction.followup.edit_message(
                 interaction.message.id,  # type: ignore
                 content=self.ctx.format_message("channels_empty"),
@@ -335,7 +483,7 @@ class YouTubeView(View):
 
         pages = []
         items_per_page = 10
-        for j, chns in enumerate(paginate_list(data["channels"], items_per_page)):
+        for j, chns in enumerate(paginate_list(channels, items_per_page)):
             desc = []
             for i, chn in enumerate(chns):
                 title = chn["title"]
@@ -363,11 +511,7 @@ class YouTubeView(View):
     @ui.button(label="btn_del", style=ButtonStyle.primary)
     async def del_channel(self, interaction: Interaction, button: ui.Button):
         await interaction.response.defer()
-        chdb = self.ctx.bot.get_db("YouTubeNews", False)
-        gddb = self.ctx.bot.get_db("YouTubeNewsGuilds", False)
-        channels = await chdb.find().to_list(None)
-        guild_data = await gddb.find_one({"_id": interaction.guild_id})  # type: ignore
-        data = get_guild_youtube_channels(channels, guild_data)["channels"]
+        data = await self.get_guild_channels(interaction.guild_id)  # type: ignore
         if not data:
             await interaction.followup.edit_message(
                 interaction.message.id,  # type: ignore
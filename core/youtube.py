@@ -0,0 +1,105 @@
+"""YouTube news utilities shared by the bot and the server."""
+
+import asyncio
+import os
+import random
+from aiohttp import ClientError
+from motor.core import AgnosticCollection
+from typing import Any, Awaitable, Callable, Optional
+
+# re-subscribing every channel, when the request URL changes
+RESUBSCRIBE_BATCH_SIZE = 100
+RESUBSCRIBE_CONCURRENCY = 10
+RESUBSCRIBE_MAX_RETRIES = 3
+
+
+def get_lease_seconds() -> int:
+    """
+    How long subscriptions to YouTube channels last, before being renewed.
+    Read when needed, since the .env file is loaded after the imports.
+    """
+    return int(os.getenv("PUBSUBHUBBUB_LEASE_SECONDS") or 864000)
+
+
+async def resubscribe_channels(
+    youtube_news: AgnosticCollection,
+    internal: AgnosticCollection,
+    subscribe: Callable[[str], Awaitable[Any]],
+    request_url: str,
+    *,
+    concurrency: int = RESUBSCRIBE_CONCURRENCY,
+    max_retries: int = RESUBSCRIBE_MAX_RETRIES,
+    restart: bool = False,
+    progress: Optional[Callable[[int, int, int], Awaitable[Any]]] = None,
+) -> dict:
+    """
+    Subscribe every YouTube channel again with `request_url`, calling
+    `subscribe` with each channel ID. Progress is stored in Internal
+    after each batch, so an interrupted run continues from the last
+    batch unless `restart` is True.
+
+    Only HTTP errors are retried and counted as failed channels, any
+    other error (such as the server being down) stops the run.
+    """
+    checkpoint = await internal.find_one({"_id": "resubscribe"})  #  type: ignore
+    if restart or checkpoint == None or checkpoint.get("request_url") != request_url:
+        checkpoint = {
+            "request_url": request_url,
+            "last_id": "",
+            "done": 0,
+            "failed": [],
+        }
+        await internal.replace_one(
+            {"_id": "resubscribe"}, checkpoint, upsert=True
+        )  #  type: ignore
+
+    query = {"guilds.0": {"$exists": True}}
+    total = await youtube_news.count_documents(query)  #  type: ignore
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _resubscribe(channel_id: str) -> bool:
+        async with sem:
+            for attempt in range(max_retries):
+                try:
+                    await subscribe(channel_id)
+                    return True
+                except ClientError:
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(2**attempt + random.random())
+
+            return False
+
+    while True:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+        cursor = youtube_news.find(query, {"_id": 1}).sort("_id", 1)  #  type: ignore
+        cursor = cursor.limit(RESUBSCRIBE_BATCH_SIZE)
+        batch = [data["_id"] for data in await cursor.to_list(None)]
+        if not batch:
+            break
+
+        tasks = [asyncio.ensure_future(_resubscribe(id)) for id in batch]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # the batch isn't stored, so it's done again next time
+            for task in tasks:
+                task.cancel()
+
+            raise
+
+        failed = [id for id, ok in zip(batch, results) if not ok]
+        checkpoint["last_id"] = batch[-1]
+        checkpoint["done"] += len(batch) - len(failed)
+        checkpoint["failed"] += failed
+        await internal.update_one(
+            {"_id": "resubscribe"},
+            {
+                "$set": {"last_id": checkpoint["last_id"], "done": checkpoint["done"]},
+                "$push": {"failed": {"$each": failed}},
+            },
+        )  #  type: ignore
+        if progress:
+            await progress(checkpoint["done"], len(checkpoint["failed"]), total)
+
+    await internal.delete_one({"_id": "resubscribe"})  #  type: ignore
+    return checkpoint
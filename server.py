@@ -1,11 +1,13 @@
 """Server for receiving requests from Google's PubSubHubbub Hub."""
 
 import os
+import sys
 import sanic
 import json
-import xmltodict
 import asyncio
-from aiohttp import ClientSession
+import random
+import time
+from aiohttp import ClientError, ClientSession, TCPConnector
 from sanic import Request, response
 from sanic.request import RequestParameters
 from sanic.log import logger, error_logger, server_logger, Colors
@@ -13,14 +15,90 @@ from dotenv import load_dotenv
 from traceback import format_exc
 from motor.motor_asyncio import AsyncIOMotorClient
 from motor.core import AgnosticClient, AgnosticCollection
-from discord import Webhook, NotFound, File, AllowedMentions
+from discord import Webhook, File, AllowedMentions
 from io import BytesIO
-from typing import Optional
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from xml.parsers import expat
+from core.youtube import (
+    RESUBSCRIBE_CONCURRENCY,
+    get_lease_seconds,
+    resubscribe_channels,
+)
 
 load_dotenv()
 app = sanic.Sanic("strapbot_server")
 mongo: Optional[AgnosticClient] = None
 db: Optional[AgnosticCollection] = None
+session: Optional[ClientSession] = None
+fanout: Optional["FanOutScheduler"] = None
+dedup: Optional["DeliveryDeduplicator"] = None
+current_request_url: Optional[str] = None
+
+# outbound HTTP connections, shared by every request the server makes
+HTTP_CONNECTION_LIMIT = int(os.getenv("SERVER_HTTP_CONNECTION_LIMIT") or 100)
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+
+# notifications fan-out, Discord allows 50 requests per second
+# globally and 5 requests every 2 seconds for each webhook
+FANOUT_CONCURRENCY = int(os.getenv("SERVER_FANOUT_CONCURRENCY") or 25)
+FANOUT_GLOBAL_RATE = 50
+FANOUT_WEBHOOK_RATE = 2.5
+FANOUT_WEBHOOK_BURST = 5
+FANOUT_MAX_RETRIES = 3
+
+# notifications queue, jobs are leased to a worker and can be claimed
+# again if it doesn't finish them before the lease expires
+QUEUE_WORKERS = int(os.getenv("SERVER_QUEUE_WORKERS") or 4)
+QUEUE_LEASE = timedelta(seconds=60)
+QUEUE_POLL_INTERVAL = 5
+QUEUE_MAX_ATTEMPTS = 5
+QUEUE_CHUNK_SIZE = 100
+
+# the hub sends the same entry again when a title is edited
+# or after a timeout, so deliveries are remembered for a while
+DEDUP_TTL = timedelta(days=7)
+DEDUP_CACHE_SIZE = 10000
+
+# feeds sent by the hub are a few kilobytes
+FEED_MAX_SIZE = 256 * 1024
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+YT_NS = "{http://www.youtube.com/xml/schemas/2015}"
+AT_NS = "{http://purl.org/atompub/tombstones/1.0}"
+
+# subscriptions expire after their lease, so they're renewed
+# in small batches some time before, at random moments to
+# avoid renewing all the channels together
+LEASE_RENEW_BEFORE = timedelta(days=1)
+LEASE_CHECK_INTERVAL = 600
+LEASE_BATCH_SIZE = 50
+LEASE_BATCH_DELAY = 10
+LEASE_CONCURRENCY = 5
+LEASE_MAX_RETRIES = 3
+LEASE_RETRY_DELAY = timedelta(hours=1)
+
+# the public IP can change when it's used as request URL,
+# so it's resolved again every once in a while
+REQUEST_URL_REFRESH_INTERVAL = int(os.getenv("SERVER_REQUEST_URL_REFRESH") or 600)
+
+
+class InvalidMessageError(ValueError):
+    """A guild's YouTube news message can't be formatted."""
+
+
+class DeliveryError(Exception):
+    """A notification couldn't be sent with a guild's webhook."""
+
+    def __init__(self, guild_id: int, status: int) -> None:
+        super().__init__(f"Guild {guild_id}'s webhook returned status {status}.")
+        self.status = status
+        # connection errors, rate limits and server errors might not happen again
+        self.retry = status == 0 or status == 429 or status >= 500
 
 
 class ReceivedChallenge(Exception):
@@ -34,24 +112,370 @@ class ReceivedChallenge(Exception):
         return f"Challenge `{self.reqa.get('hub.challenge')}` received."
 
 
+class FeedError(ValueError):
+    pass
+
+
+class FeedEntry(NamedTuple):
+    event: str  # "published" or "deleted"
+    video_id: str
+    channel_id: str
+    title: str
+    url: str
+    channel_name: str
+    channel_url: str
+
+
+def parse_feed(body: bytes) -> List[FeedEntry]:
+    """
+    Extract the entries of an Atom feed sent by the hub in a single pass,
+    reading only the fields used for notifications.
+    """
+    if len(body) > FEED_MAX_SIZE:
+        raise FeedError(f"Feed is larger than {FEED_MAX_SIZE} bytes.")
+
+    entry_tags = (ATOM_NS + "entry", AT_NS + "deleted-entry")
+    author_tags = (ATOM_NS + "author", AT_NS + "by")
+    ret = []
+    # tag, attributes and text of the open elements
+    stack: List[Tuple[str, Dict[str, str], List[str]]] = []
+    current: Optional[dict] = None
+
+    def _get_tag(name: str) -> str:
+        return "{" + name if "}" in name else name
+
+    def _reject_dtd(*args):
+        # feeds never have a DTD, refusing them avoids entity expansion attacks
+        raise FeedError("Feeds with a DTD are not allowed.")
+
+    def _start(name: str, attrs: Dict[str, str]):
+        nonlocal current
+        tag = _get_tag(name)
+        if tag in entry_tags:
+            deleted = tag == AT_NS + "deleted-entry"
+            current = {
+                "event": "deleted" if deleted else "published",
+                "video_id": attrs.get("ref", "").split(":")[-1] if deleted else "",
+            }
+        stack.append((tag, attrs, []))
+
+    def _data(data: str):
+        if current != None:
+            stack[-1][2].append(data)
+
+    def _end(name: str):
+        nonlocal current
+        tag, attrs, text_parts = stack.pop()
+        if current == None:
+            return
+
+        parent = stack[-1][0] if stack else None
+        text = "".join(text_parts).strip()
+        if tag in entry_tags:
+            channel_url = current.get("channel_url", "")
+            current.setdefault("channel_id", channel_url.split("/")[-1])
+            ret.append(
+                FeedEntry(
+                    current["event"],
+                    current.get("video_id", ""),
+                    current["channel_id"],
+                    current.get("title", ""),
+                    current.get("url", ""),
+                    current.get("channel_name", ""),
+                    channel_url,
+                )
+            )
+            current = None
+        elif tag == YT_NS + "videoId":
+            current["video_id"] = text
+        elif tag == YT_NS + "channelId":
+            current["channel_id"] = text
+        elif parent in entry_tags and tag == ATOM_NS + "title":
+            current["title"] = text
+        elif parent in entry_tags and tag == ATOM_NS + "link":
+            if attrs.get("rel", "alternate") == "alternate":
+                current["url"] = attrs.get("href", "")
+        elif parent in author_tags and tag == ATOM_NS + "name":
+            current["channel_name"] = text
+        elif parent in author_tags and tag == ATOM_NS + "uri":
+            current["channel_url"] = text
+
+    # expat is used directly, since ElementTree doesn't allow refusing DTDs
+    parser = expat.ParserCreate(namespace_separator="}")
+    parser.StartDoctypeDeclHandler = _reject_dtd
+    parser.EntityDeclHandler = _reject_dtd
+    parser.StartElementHandler = _start
+    parser.EndElementHandler = _end
+    parser.CharacterDataHandler = _data
+    try:
+        parser.Parse(body, True)
+    except expat.ExpatError as e:
+        raise FeedError(f"Invalid feed: {e}") from None
+
+    return ret
+
+
+class TokenBucket:
+    """A token bucket rate limiter that can be paused until a rate limit resets."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                elapsed = now - self.updated
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FanOutScheduler:
+    """
+    Sends webhook messages with bounded concurrency, a global and a
+    per-webhook token bucket, following Discord's rate limit headers
+    and retrying with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = FANOUT_CONCURRENCY,
+        global_rate: float = FANOUT_GLOBAL_RATE,
+        webhook_rate: float = FANOUT_WEBHOOK_RATE,
+        webhook_burst: float = FANOUT_WEBHOOK_BURST,
+        max_retries: int = FANOUT_MAX_RETRIES,
+        max_webhooks: int = 10000,
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.webhook_rate = webhook_rate
+        self.webhook_burst = webhook_burst
+        self.max_retries = max_retries
+        self.max_webhooks = max_webhooks
+        self.webhook_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.latencies: deque = deque(maxlen=1000)
+
+    def get_bucket(self, webhook_url: str) -> TokenBucket:
+        bucket = self.webhook_buckets.get(webhook_url)
+        if bucket == None:
+            bucket = TokenBucket(self.webhook_rate, self.webhook_burst)
+            self.webhook_buckets[webhook_url] = bucket
+            if len(self.webhook_buckets) > self.max_webhooks:
+                self.webhook_buckets.popitem(last=False)
+        else:
+            self.webhook_buckets.move_to_end(webhook_url)
+
+        return bucket
+
+    @staticmethod
+    def get_backoff(attempt: int) -> float:
+        return min(30, 2**attempt) * random.uniform(0.5, 1)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(self.latencies)
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0,
+        }
+
+    async def deliver(self, webhook_url: str, payload: dict) -> int:
+        """
+        Send a message with a webhook.
+        Returns the last HTTP status received, or 0 if no response was received.
+        """
+        status = 0
+        bucket = self.get_bucket(webhook_url)
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retried += 1
+
+            # waiting for a rate limited webhook doesn't take a slot of the
+            # semaphore, which is only held for the request and released
+            # before backing off, so other webhooks aren't stalled
+            headers = None
+            await bucket.acquire()
+            async with self.semaphore:
+                await self.global_bucket.acquire()
+                try:
+                    async with session.post(webhook_url, json=payload) as resp:  # type: ignore
+                        status = resp.status
+                        headers = resp.headers
+                except (ClientError, asyncio.TimeoutError):
+                    pass
+
+            if headers != None and headers.get("X-RateLimit-Remaining") == "0":
+                reset = float(headers.get("X-RateLimit-Reset-After", 1))
+                bucket.pause(reset)
+
+            if headers != None and status == 429:
+                self.rate_limited += 1
+                retry_after = float(headers.get("Retry-After", 1))
+                if headers.get("X-RateLimit-Global"):
+                    self.global_bucket.pause(retry_after)
+                else:
+                    bucket.pause(retry_after)
+
+                continue
+
+            if headers != None and status < 500:
+                if status < 300:
+                    self.delivered += 1
+                    self.latencies.append(time.monotonic() - start)
+                else:
+                    # other client errors won't change by retrying
+                    self.failed += 1
+
+                return status
+
+            # server errors and connection errors
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.get_backoff(attempt))
+
+        self.failed += 1
+        return status
+
+
+class DeliveryDeduplicator:
+    """
+    Remembers which entries have already been received, in an LRU
+    cache in front of the NotificationDedup collection, whose
+    documents expire after `DEDUP_TTL` thanks to a TTL index.
+    """
+
+    def __init__(self, ttl: timedelta = DEDUP_TTL, max_size: int = DEDUP_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.recent: "OrderedDict[str, float]" = OrderedDict()
+
+    @staticmethod
+    def get_key(video_id: str, event: str) -> str:
+        return f"{video_id}:{event}"
+
+    def _remember(self, key: str):
+        self.recent[key] = time.monotonic()
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.max_size:
+            self.recent.popitem(last=False)
+
+    async def seen(self, video_id: str, event: str) -> bool:
+        """Record a delivery, returning True if it had already been received."""
+        key = self.get_key(video_id, event)
+        stored_at = self.recent.get(key)
+        if stored_at != None and time.monotonic() - stored_at < self.ttl.total_seconds():
+            self.recent.move_to_end(key)
+            return True
+
+        try:
+            await mongo.NotificationDedup.insert_one(  #  type: ignore
+                {"_id": key, "created_at": datetime.utcnow()}
+            )
+        except DuplicateKeyError:
+            # another worker or a previous run already received it
+            self._remember(key)
+            return True
+
+        self._remember(key)
+        return False
+
+    async def forget(self, video_id: str, event: str):
+        """Forget a delivery, so it can be received again."""
+        key = self.get_key(video_id, event)
+        self.recent.pop(key, None)
+        await mongo.NotificationDedup.delete_one({"_id": key})  #  type: ignore
+
+
+async def send_error(message: str, files: List[File]):
+    env = os.getenv("ERRORS_WEBHOOK_URL", None)
+    if env != None:
+        wh = Webhook.from_url(env, session=session)  #  type: ignore
+        await wh.send(message, files=files)
+
+
 async def send_requrl_to_db(url):
     internal_db = mongo.Internal  #  type: ignore
     await internal_db.update_one({"_id": "server"}, {"$set": {"request_url": url}}, upsert=True)  # type: ignore
 
 
-async def get_request_url():
+def resolves_request_url() -> bool:
+    return not app.ctx.request_url and app.ctx.host == "0.0.0.0"
+
+
+async def resolve_request_url() -> str:
     req_url = app.ctx.request_url
-    if not req_url and app.ctx.host == "0.0.0.0":
-        async with ClientSession() as session:
-            async with session.get("http://ifconfig.me/ip") as resp:
-                req_url = (
-                    f"http://{(await resp.content.read()).decode()}:{app.ctx.port}"
-                )
+    if resolves_request_url():
+        async with session.get("http://ifconfig.me/ip") as resp:  #  type: ignore
+            resp.raise_for_status()
+            req_url = f"http://{(await resp.content.read()).decode().strip()}:{app.ctx.port}"
+
+    return req_url
+
+
+async def update_request_url() -> str:
+    """
+    Resolve the request URL and store it in
+    the database only if it has changed.
+    """
+    global current_request_url
+    req_url = await resolve_request_url()
+    if current_request_url == None:
+        data = await mongo.Internal.find_one({"_id": "server"})  #  type: ignore
+        current_request_url = (data or {}).get("request_url")
+
+    if req_url != current_request_url:
+        if current_request_url != None:
+            logger.warning(
+                f"The request URL changed from {current_request_url} to {req_url}."
+                " Channels must be subscribed again to keep receiving notifications."
+            )
+
+        await send_requrl_to_db(req_url)
+        current_request_url = req_url
 
-    await send_requrl_to_db(req_url)
     return req_url
 
 
+async def get_request_url() -> str:
+    return current_request_url or await update_request_url()
+
+
+async def request_url_refresher():
+    while True:
+        await asyncio.sleep(REQUEST_URL_REFRESH_INTERVAL)
+        try:
+            await update_request_url()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error_logger.exception("Couldn't refresh the request URL.")
+
+
 async def request_pubsubhubbub(
     channel_id: str, subscribe: bool, raise_for_status: bool = True
 ):
@@ -62,14 +486,97 @@ async def request_pubsubhubbub(
         "hub.mode": f"{'un' if not subscribe else ''}subscribe",
         "hub.verify_token": "",
         "hub.secret": "",
-        "hub.lease_seconds": "",
+        "hub.lease_seconds": str(get_lease_seconds()),
     }
-    async with ClientSession() as session:
-        async with session.post(
-            "https://pubsubhubbub.appspot.com/subscribe", data=data
-        ) as resp:
-            if raise_for_status:
-                resp.raise_for_status()
+    async with session.post(  #  type: ignore
+        "https://pubsubhubbub.appspot.com/subscribe", data=data
+    ) as resp:
+        if raise_for_status:
+            resp.raise_for_status()
+
+
+async def record_lease(args: RequestParameters) -> bool:
+    """
+    Store when the subscription verified by the hub expires,
+    returning False if the verification isn't for a YouTube channel.
+    """
+    topic = urlparse(args.get("hub.topic", ""))
+    channel_id = parse_qs(topic.query).get("channel_id", [""])[0]
+    if not channel_id:
+        return False
+
+    mode = args.get("hub.mode")
+    if mode == "subscribe":
+        lease = int(args.get("hub.lease_seconds") or get_lease_seconds())
+        now = datetime.utcnow()
+        margin = min(LEASE_RENEW_BEFORE.total_seconds(), lease / 4)
+        renew_at = now + timedelta(seconds=lease - margin * (1 + random.random()))
+        update = {
+            "$set": {
+                "lease_expires_at": now + timedelta(seconds=lease),
+                "renew_at": renew_at,
+            }
+        }
+    else:
+        update = {"$unset": {"lease_expires_at": "", "renew_at": ""}}
+
+    await db.update_one({"_id": channel_id}, update)  #  type: ignore
+    return True
+
+
+async def renew_lease(channel_id: str, renew_at: Optional[datetime]):
+    # claim the channel, so other workers don't renew it too; if every
+    # attempt fails it will be tried again after LEASE_RETRY_DELAY
+    result = await db.update_one(  #  type: ignore
+        {"_id": channel_id, "renew_at": renew_at},
+        {"$set": {"renew_at": datetime.utcnow() + LEASE_RETRY_DELAY}},
+    )
+    if not result.modified_count:
+        return
+
+    for attempt in range(LEASE_MAX_RETRIES):
+        try:
+            # the hub verifies the subscription before answering,
+            # and the verification stores the new lease
+            await request_pubsubhubbub(channel_id, True)
+            return
+        except ClientError:
+            await asyncio.sleep(2**attempt + random.random())
+
+    error_logger.warning(f"Couldn't renew the subscription to {channel_id}.")
+
+
+async def lease_renewer():
+    sem = asyncio.Semaphore(LEASE_CONCURRENCY)
+
+    async def _renew(data: dict):
+        async with sem:
+            await renew_lease(data["_id"], data.get("renew_at"))
+
+    while True:
+        try:
+            # subscriptions made before leases were stored have no renew_at
+            query = {
+                "guilds.0": {"$exists": True},
+                "$or": [
+                    {"renew_at": {"$lte": datetime.utcnow()}},
+                    {"renew_at": None},
+                ],
+            }
+            while True:
+                cursor = db.find(query, {"renew_at": 1}).limit(LEASE_BATCH_SIZE)  #  type: ignore
+                batch = await cursor.to_list(None)
+                if not batch:
+                    break
+
+                await asyncio.gather(*[_renew(data) for data in batch])
+                await asyncio.sleep(LEASE_BATCH_DELAY * (1 + random.random()))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error_logger.exception("Couldn't renew the subscriptions.")
+
+        await asyncio.sleep(LEASE_CHECK_INTERVAL * (1 + random.random() / 2))
 
 
 async def send_new_video(
@@ -81,51 +588,369 @@ async def send_new_video(
     channel_name: str,
     channel_url: str,
     yt_channel_id: str,
+    guild_config: Optional[dict] = None,
 ):
-    async with ClientSession() as session:
+    if guild_config == None:
+        cfgdb: AgnosticCollection = mongo.Configurations  #  type: ignore
+        guild_config = await cfgdb.find_one({"_id": guild_id}) or {}  # type: ignore
+
+    default = "{url}"
+    msg = guild_config.get("yt_news_message", None) or default
+    channel = f"[{channel_name}](<{channel_url}>)"
+    video = f"[{name}]({url})"
+
+    try:
+        content = msg.format(
+            name=name,
+            channel=channel,
+            channel_name=channel_name,
+            channel_url=channel_url,
+            url=url,
+            video=video,
+            link=url,
+        )
+    except (KeyError, IndexError, ValueError, AttributeError) as e:
+        raise InvalidMessageError(f"Guild {guild_id} has an invalid message: {e!r}")
+
+    mentions = AllowedMentions(everyone=True, users=False, roles=True)
+    payload = {"content": content, "allowed_mentions": mentions.to_dict()}
+
+    # the webhook is used directly from its URL, fetching
+    # it first would cost one more request per guild
+    status = await fanout.deliver(webhook_url, payload)  #  type: ignore
+    if status == 404:
+        # the webhook has been deleted
+        guilds_db = mongo.YouTubeNewsGuilds  #  type: ignore
+        await guilds_db.update_one(
+            {"_id": guild_id, "needs_new_webhook": {"$ne": True}},
+            {"$set": {"needs_new_webhook": True}},
+        )
+
+    if not 200 <= status < 300:
+        raise DeliveryError(guild_id, status)
+
+    return status
+
+
+async def enqueue_notification(**job):
+    """Store a notification for the workers to send it."""
+    now = datetime.utcnow()
+    job.update(
+        status="pending",
+        created_at=now,
+        lease_until=now,
+        attempts=0,
+        delivered=[],
+        failed=[],
+    )
+    await mongo.NotificationQueue.insert_one(job)  #  type: ignore
+    app.ctx.queue_event.set()
+
+
+async def claim_notification(worker: str) -> Optional[dict]:
+    """Lease the oldest notification that isn't being sent by another worker."""
+    now = datetime.utcnow()
+    queue: AgnosticCollection = mongo.NotificationQueue  #  type: ignore
+    return await queue.find_one_and_update(  #  type: ignore
+        {
+            "status": "pending",
+            "lease_until": {"$lte": now},
+            "attempts": {"$lt": QUEUE_MAX_ATTEMPTS},
+        },
+        {
+            "$set": {"lease_until": now + QUEUE_LEASE, "worker": worker},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def fail_exhausted_notifications():
+    """Give up on the notifications that used all their attempts."""
+    now = datetime.utcnow()
+    await mongo.NotificationQueue.update_many(  #  type: ignore
+        {
+            "status": "pending",
+            "lease_until": {"$lte": now},
+            "attempts": {"$gte": QUEUE_MAX_ATTEMPTS},
+        },
+        {"$set": {"status": "failed", "finished_at": now}},
+    )
+
+
+async def keep_lease(job: dict):
+    """Renew a job's lease until cancelled, so no other worker claims it."""
+    queue: AgnosticCollection = mongo.NotificationQueue  #  type: ignore
+    while True:
+        await asyncio.sleep(QUEUE_LEASE.total_seconds() / 3)
         try:
-            webhook = await Webhook.from_url(
-                webhook_url, session=session, bot_token=os.getenv("TOKEN")
-            ).fetch()
-        except NotFound:
-            guilds_db = mongo.YouTubeNewsGuilds  #  type: ignore
-            gdata = await guilds_db.find_one({"_id": guild_id})
-            if not gdata.get("needs_new_webhook", False):
-                await guilds_db.update_one(
-                    {"_id": guild_id}, {"$set": {"needs_new_webhook": True}}
-                )
-        else:
-            cfgdb: AgnosticCollection = mongo.Configurations  #  type: ignore
-            guild_config: dict = await cfgdb.find_one({"_id": webhook.guild_id})  # type: ignore
-            default = "{url}"
-            msg = guild_config.get("yt_news_message", None) or default
-            channel = f"[{channel_name}](<{channel_url}>)"
-            video = f"[{name}]({url})"
-            await webhook.send(
-                msg.format(
-                    name=name,
-                    channel=channel,
-                    channel_name=channel_name,
-                    channel_url=channel_url,
-                    url=url,
-                    video=video,
-                    link=url,
-                ),
-                allowed_mentions=AllowedMentions(
-                    everyone=True, users=False, roles=True
-                ),
+            await queue.update_one(  #  type: ignore
+                {"_id": job["_id"], "worker": job["worker"]},
+                {"$set": {"lease_until": datetime.utcnow() + QUEUE_LEASE}},
             )
+        except Exception:
+            error_logger.exception(f"Could not renew the lease of {job['_id']}.")
+
+
+async def send_notification_chunk(
+    job: dict, guilds: List[dict], configs: dict
+) -> int:
+    """Notify a chunk of guilds, returning how many of them should be retried."""
+    results = await asyncio.gather(
+        *[
+            send_new_video(
+                gdata["webhook_url"],
+                job["title"],
+                job["url"],
+                gdata["_id"],
+                job["channel_id"],
+                job["channel_name"],
+                job["channel_url"],
+                job["channel_id"],
+                configs.get(gdata["_id"], {}),
+            )
+            for gdata in guilds
+        ],
+        return_exceptions=True,
+    )
+
+    # a guild failing must not make the others be notified again
+    delivered = []
+    failed = []
+    retry = 0
+    for gdata, result in zip(guilds, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        elif isinstance(result, InvalidMessageError) or (
+            isinstance(result, DeliveryError) and not result.retry
+        ):
+            # trying again wouldn't change anything
+            failed.append(gdata["_id"])
+            error_logger.warning(str(result))
+        elif isinstance(result, BaseException):
+            retry += 1
+            error_logger.warning(
+                f"Could not notify guild {gdata['_id']}: {type(result).__name__}: {result}"
+            )
+        else:
+            delivered.append(gdata["_id"])
+
+    # the guilds that are done are recorded so a job picked
+    # up again after a failure doesn't notify them twice
+    queue: AgnosticCollection = mongo.NotificationQueue  #  type: ignore
+    await queue.update_one(  #  type: ignore
+        {"_id": job["_id"]},
+        {
+            "$addToSet": {
+                "delivered": {"$each": delivered},
+                "failed": {"$each": failed},
+            }
+        },
+    )
+    return retry
+
+
+async def process_notification(job: dict):
+    channel_id = job["channel_id"]
+    guilds = ((await db.find_one({"_id": channel_id})) or {}).get(  #  type: ignore
+        "guilds", []
+    )
+    if not guilds:
+        await request_pubsubhubbub(channel_id, False, False)
+        await db.delete_one({"_id": channel_id})  # type: ignore
+    else:
+        done = set(job["delivered"]) | set(job.get("failed", []))
+        pending = [g for g in guilds if g not in done]
+
+        # the guilds' configs and webhooks are fetched with one
+        # query each instead of one query per guild, and the
+        # notifications start as soon as a chunk of webhooks arrives
+        cfgdb: AgnosticCollection = mongo.Configurations  #  type: ignore
+        gdb: AgnosticCollection = mongo.YouTubeNewsGuilds  #  type: ignore
+        query = {"_id": {"$in": pending}}
+        configs = {
+            cfg["_id"]: cfg
+            async for cfg in cfgdb.find(query, {"yt_news_message": 1})  # type: ignore
+        }
+        chunk = []
+        retry = 0
+        async for gdata in gdb.find(query):  # type: ignore
+            chunk.append(gdata)
+            if len(chunk) >= QUEUE_CHUNK_SIZE:
+                retry += await send_notification_chunk(job, chunk, configs)
+                chunk = []
+
+        if chunk:
+            retry += await send_notification_chunk(job, chunk, configs)
+
+        if retry:
+            # only the guilds that weren't notified are tried again
+            raise RuntimeError(f"Could not notify {retry} guilds.")
+
+    await mongo.NotificationQueue.update_one(  #  type: ignore
+        {"_id": job["_id"]},
+        {"$set": {"status": "done", "finished_at": datetime.utcnow()}},
+    )
+
+
+async def notification_worker(name: str):
+    while True:
+        try:
+            job = await claim_notification(name)
+        except Exception:
+            error_logger.exception("Could not claim a notification.")
+            job = None
+
+        if job == None:
+            try:
+                await fail_exhausted_notifications()
+            except Exception:
+                error_logger.exception("Could not clean up the notifications.")
+
+            app.ctx.queue_event.clear()
+            try:
+                await asyncio.wait_for(
+                    app.ctx.queue_event.wait(), QUEUE_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+            continue
+
+        keeper = asyncio.create_task(keep_lease(job))
+        try:
+            await process_notification(job)
+        except Exception as e:
+            # the job will be retried once its lease expires,
+            # unless it has no attempts left
+            error_logger.exception(f"Could not send notification {job['_id']}.")
+            if job["attempts"] >= QUEUE_MAX_ATTEMPTS:
+                try:
+                    await mongo.NotificationQueue.update_one(  #  type: ignore
+                        {"_id": job["_id"]},
+                        {"$set": {"status": "failed", "finished_at": datetime.utcnow()}},
+                    )
+                except Exception:
+                    pass
+
+            job.pop("delivered", None)
+            files = [
+                File(BytesIO(format_exc().encode()), "traceback.py"),
+                File(BytesIO(json.dumps(job, indent=4, default=str).encode()), "job.json"),
+            ]
+            message = f"{type(e).__name__}: {str(e)}"
+            if job["attempts"] >= QUEUE_MAX_ATTEMPTS:
+                message = f"Gave up after {job['attempts']} attempts. {message}"
+
+            try:
+                await send_error(message, files)
+            except Exception:
+                pass
+        finally:
+            keeper.cancel()
+
+
+async def resubscribe_all(
+    concurrency: int = RESUBSCRIBE_CONCURRENCY, restart: bool = False
+) -> dict:
+    """Subscribe every YouTube channel again with the current request URL."""
+
+    async def progress(done: int, failed: int, total: int):
+        logger.info(f"Subscribed {done} channels, {failed} failed ({done + failed}/{total}).")
+
+    return await resubscribe_channels(
+        db,  #  type: ignore
+        mongo.Internal,  #  type: ignore
+        lambda channel_id: request_pubsubhubbub(channel_id, True),
+        await get_request_url(),
+        concurrency=concurrency,
+        max_retries=LEASE_MAX_RETRIES,
+        restart=restart,
+        progress=progress,
+    )
+
+
+async def resubscribe_command(args: List[str]):
+    """Run `resubscribe_all` from the command line, without starting the server."""
+    global mongo, db, session
+    restart = "--restart" in args
+    concurrency = RESUBSCRIBE_CONCURRENCY
+    if "--concurrency" in args:
+        concurrency = int(args[args.index("--concurrency") + 1])
+
+    mongo = AsyncIOMotorClient(os.getenv("MONGO_URI")).strapbotrew
+    db = mongo.YouTubeNews  # type: ignore
+    session = ClientSession()
+    try:
+        ret = await resubscribe_all(concurrency, restart)
+    finally:
+        await session.close()
+
+    for channel_id in ret["failed"]:
+        error_logger.warning(f"Couldn't subscribe to {channel_id}.")
 
 
 @app.before_server_start
 async def before_server_start(app, loop):
-    global mongo, db
+    global mongo, db, session, fanout, dedup
+    # larger bodies are refused before being read
+    app.config.REQUEST_MAX_SIZE = FEED_MAX_SIZE
     mongo = AsyncIOMotorClient(os.getenv("MONGO_URI"), io_loop=loop).strapbotrew
     await mongo.command({"ping": 1})  #  type: ignore
     db = mongo.YouTubeNews  # type: ignore
     app.ctx.mongo = mongo
     app.ctx.db = db
-    await get_request_url()
+    app.ctx.session = session = ClientSession(
+        connector=TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+    )
+    app.ctx.fanout = fanout = FanOutScheduler()
+    app.ctx.dedup = dedup = DeliveryDeduplicator()
+    await mongo.NotificationDedup.create_index(  #  type: ignore
+        "created_at",
+        name="ClearIndex",
+        expireAfterSeconds=int(DEDUP_TTL.total_seconds()),
+    )
+    app.ctx.queue_event = asyncio.Event()
+    queue: AgnosticCollection = mongo.NotificationQueue  #  type: ignore
+    await queue.create_index(
+        [("status", 1), ("lease_until", 1)], name="ClaimIndex"
+    )  #  type: ignore
+    # 86400s = 24h
+    await queue.create_index(
+        "finished_at", name="ClearIndex", expireAfterSeconds=86400
+    )  #  type: ignore
+    await db.create_index("renew_at", name="RenewIndex")  #  type: ignore
+    await update_request_url()
+
+
+@app.after_server_start
+async def after_server_start(app, loop):
+    app.ctx.workers = [
+        loop.create_task(notification_worker(f"{os.getpid()}-{i}"))
+        for i in range(QUEUE_WORKERS)
+    ]
+    app.ctx.workers.append(loop.create_task(lease_renewer()))
+    if resolves_request_url():
+        app.ctx.workers.append(loop.create_task(request_url_refresher()))
+
+
+@app.before_server_stop
+async def before_server_stop(app, loop):
+    for worker in getattr(app.ctx, "workers", []):
+        worker.cancel()
+
+    await asyncio.gather(*getattr(app.ctx, "workers", []), return_exceptions=True)
+
+
+@app.after_server_stop
+async def after_server_stop(app, loop):
+    if session != None:
+        await session.close()
 
 
 @app.get("/")
@@ -133,76 +958,69 @@ async def ping(request: Request):
     return response.empty()
 
 
+@app.get("/stats")
+async def stats(request: Request):
+    return response.json(fanout.stats)  #  type: ignore
+
+
 @app.route("/notify", methods=["GET", "POST"])
 async def notify(request: Request):
     try:
-        db: AgnosticCollection = app.ctx.db
         challenge = request.args.get("hub.challenge", "")
-        if challenge:
-            raise ReceivedChallenge(request.args)
+        if challenge and not request.args.get("hub.mode"):
+            # the bot checking if the server is running
+            return response.text(challenge)
+        elif challenge:
+            # verifications of channel subscriptions happen for every
+            # renewal, so only the unexpected ones are reported
+            if not await record_lease(request.args):
+                raise ReceivedChallenge(request.args)
 
-        data = xmltodict.parse(request.body)
-        feed = data["feed"]
+            return response.text(challenge)
 
-        if "at:deleted-entry" in feed:
-            channel_id = feed["at:deleted-entry"]["at:by"]["uri"].split("/")[-1]
-        else:
-            channel_id = feed["entry"]["yt:channelId"]
+        for entry in parse_feed(request.body):
+            if entry.event == "deleted":
+                # there's nothing to notify for deleted videos
+                continue
 
-        entry = feed["entry"]
-        url = entry["link"]["@href"]
-        guilds = ((await db.find_one({"_id": channel_id})) or {}).get(  #  type: ignore
-            "guilds", []
-        )
-        if not guilds:
-            await request_pubsubhubbub(channel_id, False, False)
-            await db.delete_one({"_id": channel_id})  # type: ignore
-            return response.empty()
-
-        tasks = []
-        title = entry["title"]
-        author = entry["author"]
-        channel_name = author["name"]
-        channel_url = author["uri"]
-        for guild_id in guilds:
-            gdb = mongo.YouTubeNewsGuilds  #  type: ignore
-            gdata = await gdb.find_one({"_id": guild_id})
-            tasks.append(
-                send_new_video(
-                    gdata["webhook_url"],
-                    title,
-                    url,
-                    guild_id,
-                    channel_id,
-                    channel_name,
-                    channel_url,
-                    channel_id,
-                )
-            )
+            # repeated deliveries are dropped before touching anything else
+            if entry.video_id and await dedup.seen(entry.video_id, entry.event):  #  type: ignore
+                continue
 
-        await asyncio.gather(*tasks)
+            # the notification is only stored here, so the hub gets its
+            # response right away instead of waiting for the whole fan-out
+            try:
+                await enqueue_notification(
+                    channel_id=entry.channel_id,
+                    video_id=entry.video_id,
+                    title=entry.title,
+                    url=entry.url,
+                    channel_name=entry.channel_name,
+                    channel_url=entry.channel_url,
+                )
+            except Exception:
+                # let the hub's next delivery go through
+                if entry.video_id:
+                    await dedup.forget(entry.video_id, entry.event)  #  type: ignore
+                raise
 
         return response.empty()
     except Exception as e:
-        env = os.getenv("ERRORS_WEBHOOK_URL", None)
-        if env != None:
-            async with ClientSession() as session:
-                wh = Webhook.from_url(env, session=session)
-                files = []
-                if request.args:
-                    files.append(
-                        File(
-                            BytesIO(json.dumps(request.args, indent=4).encode()),
-                            "args.json",
-                        )
-                    )
+        files = []
+        if request.args:
+            files.append(
+                File(
+                    BytesIO(json.dumps(request.args, indent=4).encode()),
+                    "args.json",
+                )
+            )
 
-                if not isinstance(e, ReceivedChallenge):
-                    files.append(File(BytesIO(format_exc().encode()), "traceback.py"))
+        if not isinstance(e, ReceivedChallenge):
+            files.append(File(BytesIO(format_exc().encode()), "traceback.py"))
 
-                if request.body:
-                    files.append(File(BytesIO(request.body), "body.xml"))
-                await wh.send(f"{type(e).__name__}: {str(e)}", files=files)
+        if request.body:
+            files.append(File(BytesIO(request.body), "body.xml"))
+        await send_error(f"{type(e).__name__}: {str(e)}", files)
         if isinstance(e, ReceivedChallenge):
             return response.text(e.challenge)
         else:
@@ -269,4 +1087,9 @@ def main(
 
 if __name__ in ["__main__", "__mp_main__"]:
     host, port, debug, dev, request_url = get_envs()
-    main(host, port, debug, dev, request_url, __name__ != "__mp_main__")
+    if sys.argv[1:2] == ["resubscribe"]:
+        # python server.py resubscribe [--restart] [--concurrency N]
+        main(host, port, debug, dev, request_url, False)
+        asyncio.run(resubscribe_command(sys.argv[2:]))
+    else:
+        main(host, port, debug, dev, request_url, __name__ != "__mp_main__")
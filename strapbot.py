@@ -3,6 +3,7 @@ import os
 import random
 import string
 import sys
+import time
 import traceback
 import typing
 import discord
@@ -15,8 +16,14 @@ from typing_extensions import Self
 from discord import Message, Interaction
 from motor.core import AgnosticClient, AgnosticCollection, AgnosticDatabase
 from motor.motor_asyncio import AsyncIOMotorClient
-from core.config import AnyConfig, Config, UserConfig, GuildConfig
+from core.config import (
+    AnyConfig,
+    Config,
+    ConfigCache,
+    migrate_configs,
+)
 from core.context import StrapContext
+from core.youtube import get_lease_seconds
 from core.utils import (
     IS_TERMINAL,
     HANDLER as logging_handler,
@@ -25,6 +32,7 @@ from core.utils import (
     configure_logging,
     get_logger,
     MyTranslator,
+    LANG_CATALOG,
     is_debugging,
 )
 from discord.ext.commands.bot import _default
@@ -54,6 +62,7 @@ class StrapBot(commands.Bot):
             discord.AllowedMentions
         ] = discord.AllowedMentions.none(),
         use_repl: bool = False,
+        lazy_configs: bool = True,
         **options: typing.Any,
     ):
         super().__init__(
@@ -65,7 +74,8 @@ class StrapBot(commands.Bot):
             allowed_mentions=allowed_mentions,
             **options,
         )
-        self.__cached_configs: Dict[int, AnyConfig] = {}
+        self.config_cache = ConfigCache()
+        self.__config_loads: Dict[int, asyncio.Task] = {}
         self.mongoclient: AgnosticClient
         self.mongodb: AgnosticDatabase
         self.session: ClientSession
@@ -73,12 +83,29 @@ class StrapBot(commands.Bot):
         self.webhook_url = webhook_url
         self.main_guild: typing.Optional[discord.Guild] = None
         self.use_repl = use_repl
+        self.lazy_configs = lazy_configs
         self.console = None
+        # YouTube news server status, kept up to date by the server monitor
+        self.server_check_interval = float(os.getenv("SERVER_CHECK_INTERVAL") or 60)
+        self.server_url: typing.Optional[str] = None
+        self.__server_online = False
+        self.__server_checked_at = 0.0
+        self.__server_monitor: typing.Optional[asyncio.Task] = None
 
     @property
     def debugging(self) -> bool:
         return is_debugging()
 
+    @property
+    def youtube_news_available(self) -> bool:
+        """
+        Whether the YouTube news server was running the last time it was
+        checked. A result older than two check intervals is considered
+        stale, in case the server monitor stopped.
+        """
+        age = time.monotonic() - self.__server_checked_at
+        return self.__server_online and age <= self.server_check_interval * 2
+
     def do_give_prefixes(
         self, bot, message: typing.Optional[Message]
     ) -> typing.List[str]:
@@ -94,31 +121,61 @@ class StrapBot(commands.Bot):
         p = self.do_give_prefixes(bot, message)
         return commands.when_mentioned_or(*p)(bot, message)  # type: ignore
 
-    def get_cached_config(self, id: int):
-        if id in self.__cached_configs:
-            return self.__cached_configs[id]
+    def get_cached_config(self, id: int) -> typing.Optional[AnyConfig]:
+        return self.config_cache.get(id)
+
+    def invalidate_config(self, id: typing.Optional[int] = None):
+        """Remove a config from the cache, or all of them if no ID is given."""
+        self.config_cache.invalidate(id)
 
     async def get_config(
         self, target: typing.Union[discord.Guild, discord.User, discord.Member, int]
     ) -> AnyConfig:
         """Get a Config instance for a guild or user"""
-        if not isinstance(target, int):
-            id = target.id
+        id = target if isinstance(target, int) else target.id
 
         cfg = self.get_cached_config(id)
         if not cfg:
-            ret: typing.Union[discord.Guild, discord.User, None] = None
-            if isinstance(target, int):
-                ret = self.get_guild(target) or self.get_user(target)
+            # concurrent cache misses for the same target share one load
+            task = self.__config_loads.get(id)
+            if task == None:
+                task = self.loop.create_task(self._load_config(target))
+                self.__config_loads[id] = task
+                task.add_done_callback(lambda _: self.__config_loads.pop(id, None))
 
-            if isinstance(target, discord.Member):
-                ret = self.get_user(target.id)  # must be User and not Member
+            # shielded so a cancelled waiter doesn't cancel the others
+            cfg = await asyncio.shield(task)
 
-            cfg = await Config.create_config(self, ret or target)  #  type: ignore
-            self.__cached_configs[id] = cfg
+        return cfg
 
+    async def _load_config(
+        self, target: typing.Union[discord.Guild, discord.User, discord.Member, int]
+    ) -> AnyConfig:
+        ret: typing.Union[discord.Guild, discord.User, None] = None
+        if isinstance(target, int):
+            ret = self.get_guild(target) or self.get_user(target)
+
+        if isinstance(target, discord.Member):
+            ret = self.get_user(target.id)  # must be User and not Member
+
+        cfg = await Config.create_config(self, ret or target)  #  type: ignore
+        self.config_cache.put(cfg)
         return cfg
 
+    async def migrate_configs(self) -> Dict[str, int]:
+        """Add new configurations' defaults to every entry in the database."""
+        logger.debug("Migrating configurations...")
+        ret = await migrate_configs(self)
+        # cached configs might miss the new values
+        self.invalidate_config()
+        if any(ret.values()):
+            logger.info(
+                f"Migrated [bold]{sum(ret.values())}[/] configurations.",
+                extra={"highlighter": None},
+            )
+
+        return ret
+
     def get_db(self, dbname, cog=True):
         name = dbname
         if cog:
@@ -168,8 +225,31 @@ class StrapBot(commands.Bot):
                 "query", name="QueriesIndex", unique=True
             )  #  type: ignore
 
+        # multikey index to find the YouTube channels of a guild
+        youtube_news = self.get_db("YouTubeNews", cog=False)
+        await youtube_news.create_index("guilds", name="GuildsIndex")  #  type: ignore
+
+        # used to find the outdated configurations to migrate
+        configs = self.get_db("Configurations", cog=False)
+        await configs.create_index(
+            [("type", 1), ("schema_version", 1)], name="SchemaIndex"
+        )  #  type: ignore
+
         logger.info(f"Connected to {mongodb} database.")
 
+        # Languages
+        logger.debug("Loading languages...")
+        await self.loop.run_in_executor(None, LANG_CATALOG.load)
+        logger.info(f"Loaded [bold]{len(LANG_CATALOG.langs)}[/] languages.")
+
+        # the languages are needed to validate the default values
+        if os.getenv("MIGRATE_CONFIGS", "false").lower() in ["true", "1"]:
+            try:
+                await self.migrate_configs()
+            except Exception as e:
+                # configs are still completed when they're fetched
+                logger.error("Could not migrate configurations.", exc_info=e)
+
         # REPL and debugging
         if self.use_repl:
             if self.debugging:
@@ -253,7 +333,7 @@ class StrapBot(commands.Bot):
 
         # YouTube news
         # It would have taken too long to start the bot in some cases
-        self.loop.create_task(self.check_youtube_news(True))
+        self.__server_monitor = self.loop.create_task(self.monitor_youtube_news())
 
         # Application commands
         main_guild_id = os.getenv("MAIN_GUILD_ID", None)
@@ -275,13 +355,19 @@ class StrapBot(commands.Bot):
             if log:
                 logger.log(level, *args, **kwargs)
 
+        def _set_status(online: bool, url: typing.Optional[str] = None) -> bool:
+            self.__server_online = online
+            self.__server_checked_at = time.monotonic()
+            self.server_url = url
+            return online
+
         _maybe_log(logging.DEBUG, "Checking if the server is running...")
         internal = self.get_db("Internal", cog=False)
         data = await internal.find_one({"_id": "server"})  #  type: ignore
         yt_msg = "The server hasn't been set up yet. YouTube news will not work."
         if data == None or (data and data.get("request_url", None) == None):
             _maybe_log(logging.WARNING, yt_msg)
-            return False
+            return _set_status(False)
         elif data and data.get("request_url") != None:
             chg = list(str(random.randint(0, 10000000000000000000)))
             if len(chg) >= 3:
@@ -307,31 +393,56 @@ class StrapBot(commands.Bot):
                         req.status < 200 or req.status >= 300
                     ):
                         _maybe_log(logging.WARNING, yt_msg)
-                        return False
+                        return _set_status(False)
             except Exception:
                 _maybe_log(
                     logging.WARNING,
                     "The server might be down. Check if it's running for YouTube news to work.",
                 )
-                return False
+                return _set_status(False)
 
-        return True
+        return _set_status(True, data["request_url"])
+
+    async def monitor_youtube_news(self):
+        """
+        Check the YouTube news server periodically, so the cached
+        status can be used instead of checking it every time.
+        """
+        first = True
+        online = False
+        while not self.is_closed():
+            was_online = online
+            try:
+                # only the first check logs its result, then changes are logged
+                online = await self.check_youtube_news(first)
+            except Exception as e:
+                logger.error("Couldn't check the server's status.", exc_info=e)
+                online = False
+
+            if first:
+                first = False
+            elif online and not was_online:
+                logger.info("The server is running. YouTube news will work.")
+            elif was_online and not online:
+                logger.warning(
+                    "The server might be down. Check if it's running for YouTube news to work."
+                )
+
+            await asyncio.sleep(self.server_check_interval)
 
     async def request_pubsubhubbub(
         self, channel_id: str, subscribe: bool, raise_for_status: bool = True
     ):
         """Sends a request to Google's PubSubHubbub Hub."""
-        assert await self.check_youtube_news(), "The server is down."
-        internal = self.get_db("Internal", cog=False)
-        serverdata = await internal.find_one({"_id": "server"})  #  type: ignore
+        assert self.youtube_news_available, "The server is down."
         data = {
-            "hub.callback": f"{serverdata['request_url']}/notify",
+            "hub.callback": f"{self.server_url}/notify",
             "hub.topic": f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}",
             "hub.verify": "sync",
             "hub.mode": f"{'un' if not subscribe else ''}subscribe",
             "hub.verify_token": "",
             "hub.secret": "",
-            "hub.lease_seconds": "",
+            "hub.lease_seconds": str(get_lease_seconds()),
         }
         async with self.session.post(
             "https://pubsubhubbub.appspot.com/subscribe", data=data
@@ -357,16 +468,13 @@ class StrapBot(commands.Bot):
         if not issubclass(cls, StrapContext):
             raise TypeError("context class must inherit from StrapContext")
 
-        if isinstance(origin, Interaction):
-            author = origin.user
-        else:
-            author = origin.author
+        ctx = await super().get_context(origin, cls=cls)
+        # with lazy configs, configs are only loaded for messages that
+        # invoke a command, so normal chat messages never hit the database
+        if not self.lazy_configs or ctx.command != None:
+            await ctx.load_configs()
 
-        user_config: UserConfig = await self.get_config(author)  #  type: ignore
-        guild_config: GuildConfig = await self.get_config(origin.guild)  # type: ignore
-        return await super().get_context(
-            origin, cls=cls.configure(user_config, guild_config)
-        )
+        return ctx
 
     @staticmethod
     def create_random_string(length=10):
@@ -462,6 +570,8 @@ class StrapBot(commands.Bot):
     async def close(self):
         if self.use_repl and not self.debugging and self.console:
             self.console.stop()
+        if self.__server_monitor:
+            self.__server_monitor.cancel()
         await self.session.close()
         return await super().close()
 
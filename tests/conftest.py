@@ -0,0 +1,15 @@
+import json
+import pytest
+from core.utils import LANG_CATALOG
+
+
+@pytest.fixture
+def langs(tmp_path, monkeypatch):
+    """An English-only langs folder, since the real one isn't part of the repo."""
+    en = tmp_path / "en"
+    en.mkdir()
+    (en / "__data__.json").write_text(json.dumps({"code": "en", "name": "English"}))
+    monkeypatch.setattr(LANG_CATALOG, "path", str(tmp_path))
+    LANG_CATALOG.load()
+    yield LANG_CATALOG
+    LANG_CATALOG.loaded = False
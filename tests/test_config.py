@@ -0,0 +1,148 @@
+import asyncio
+import gc
+import pytest
+import tracemalloc
+from core.config import CONFIG_SCHEMAS, Config, ConfigCache, GuildConfig, UserConfig
+
+
+class DictConfig:
+    """How configs were stored before, with the whole entry in a dict."""
+
+    __slots__ = ("bot", "_data", "schema", "id", "db")
+
+    def __init__(self, bot, **data):
+        self.bot = bot
+        self._data = data
+        self.schema = CONFIG_SCHEMAS[data["type"]]
+        self.id = data["_id"]
+        self.db = None
+
+
+def create_entries(kind: str, count: int) -> list:
+    schema = CONFIG_SCHEMAS[kind]
+    return [
+        {
+            "_id": 10**17 + i,
+            "type": kind,
+            "schema_version": schema.version,
+            **schema.base,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(cls, entries: list) -> float:
+    """Bytes kept by each config created from `entries`."""
+    # the first config also imports the bot, which isn't part of the result
+    cls(None, **entries[0])
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        configs = [cls(None, **entry) for entry in entries]
+        size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    assert len(configs) == len(entries)
+    return size / len(entries)
+
+
+def test_config_memory():
+    """Bytes per cached config before and after, run with -s to see the results."""
+    print()
+    for kind, cls in (("user", UserConfig), ("guild", GuildConfig)):
+        entries = create_entries(kind, 10000)
+        before = measure(DictConfig, entries)
+        after = measure(cls, entries)
+        print(f"{kind}: {before:.0f} bytes per config before, {after:.0f} after")
+        assert after < before
+
+
+class CountingCollection:
+    """Wraps a collection, counting the requests sent to it."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+
+        return call
+
+
+class FakeBot:
+    def __init__(self, collection):
+        self.db = CountingCollection(collection)
+        self.config_cache = ConfigCache()
+
+    def get_db(self, name, cog=True):
+        return self.db
+
+    def get_guild(self, id):
+        return None
+
+    def get_user(self, id):
+        return None
+
+
+class User:
+    def __init__(self, id):
+        self.id = id
+
+
+class Guild(User):
+    pass
+
+
+def create_bot() -> FakeBot:
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return FakeBot(mongomock_motor.AsyncMongoMockClient().strapbot.Configurations)
+
+
+def test_first_contact_is_one_round_trip(langs):
+    bot = create_bot()
+
+    async def run():
+        user = await Config.create_config(bot, User(1))
+        guild = await Config.create_config(bot, Guild(2))
+        return user, guild
+
+    user, guild = asyncio.run(run())
+    assert bot.db.calls == ["find_one_and_update", "find_one_and_update"]
+    assert isinstance(user, UserConfig) and isinstance(guild, GuildConfig)
+    assert user.lang == "en" and guild.lang == "en"
+
+
+def test_existing_entry_is_one_round_trip(langs):
+    bot = create_bot()
+
+    async def run():
+        await Config.create_config(bot, User(1))
+        bot.db.calls.clear()
+        return await Config.create_config(bot, User(1))
+
+    config = asyncio.run(run())
+    assert bot.db.calls == ["find_one_and_update"]
+    assert config.ping_on_reply == True
+
+
+def test_set_is_one_round_trip(langs):
+    bot = create_bot()
+
+    async def run():
+        config = await Config.create_config(bot, User(1))
+        bot.db.calls.clear()
+        await config.set(ping_on_reply=False)
+        return config
+
+    config = asyncio.run(run())
+    assert bot.db.calls == ["find_one_and_update"]
+    assert config.ping_on_reply == False
+    # the cache is updated with the new values
+    assert bot.config_cache.get(1) is config
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+import random
+from types import SimpleNamespace
+from discord.ext.commands.view import StringView
+from core.context import StrapContext
+
+
+class FakeBot:
+    """Returns one config per target, after a random delay."""
+
+    def __init__(self):
+        self.loads = 0
+
+    async def get_config(self, target):
+        self.loads += 1
+        await asyncio.sleep(random.random() / 100)
+        return SimpleNamespace(id=target.id)
+
+    def get_cached_config(self, id):
+        return None
+
+
+def create_context(bot: FakeBot, user_id: int, guild_id=None) -> StrapContext:
+    guild = SimpleNamespace(id=guild_id) if guild_id != None else None
+    message = SimpleNamespace(
+        author=SimpleNamespace(id=user_id), guild=guild, channel=None, _state=None
+    )
+    return StrapContext(message=message, bot=bot, view=StringView(""))  # type: ignore
+
+
+def test_concurrent_contexts_keep_their_configs():
+    bot = FakeBot()
+    contexts = [
+        create_context(bot, i, 10000 + i if i % 3 else None) for i in range(1200)
+    ]
+
+    async def _load():
+        await asyncio.gather(*[ctx.load_configs() for ctx in contexts])
+
+    asyncio.run(_load())
+    for i, ctx in enumerate(contexts):
+        assert ctx.user_config.id == i
+        if i % 3:
+            assert ctx.guild_config.id == 10000 + i
+
+    # 1200 user configs and 800 guild configs
+    assert bot.loads == 2000
+
+
+def test_configs_are_not_shared_between_instances():
+    bot = FakeBot()
+    first = create_context(bot, 1, 2)
+    second = create_context(bot, 3, 4)
+    asyncio.run(first.load_configs())
+    assert first.user_config.id == 1
+
+    # the configs loaded by the first context aren't leaked to the second one
+    with pytest.raises(RuntimeError):
+        second.user_config
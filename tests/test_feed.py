@@ -0,0 +1,113 @@
+import time
+import pytest
+from server import FEED_MAX_SIZE, FeedError, parse_feed
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+ <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+ <link rel="self" href="https://www.youtube.com/xml/feeds/videos.xml?channel_id=UCabc"/>
+ <title>YouTube video feed</title>
+ <updated>2026-10-18T12:00:00.000000+00:00</updated>
+ <entry>
+  <id>yt:video:VID1</id>
+  <yt:videoId>VID1</yt:videoId>
+  <yt:channelId>UCabc</yt:channelId>
+  <title>Video &amp; title</title>
+  <link rel="alternate" href="https://www.youtube.com/watch?v=VID1"/>
+  <author>
+   <name>Channel</name>
+   <uri>https://www.youtube.com/channel/UCabc</uri>
+  </author>
+  <published>2026-10-18T12:00:00+00:00</published>
+  <updated>2026-10-18T12:00:00.000000+00:00</updated>
+ </entry>
+</feed>"""
+
+DELETED_FEED = """<feed xmlns:at="http://purl.org/atompub/tombstones/1.0" xmlns="http://www.w3.org/2005/Atom">
+ <at:deleted-entry ref="yt:video:VID2" when="2026-10-18T12:00:00+00:00">
+  <link href="https://www.youtube.com/watch?v=VID2"/>
+  <at:by>
+   <name>Channel</name>
+   <uri>https://www.youtube.com/channel/UCabc</uri>
+  </at:by>
+ </at:deleted-entry>
+</feed>"""
+
+DTD_FEED = """<?xml version="1.0" encoding="UTF-16"?>
+<!DOCTYPE feed [<!ENTITY a "aaaa">]>
+<feed xmlns="http://www.w3.org/2005/Atom"><entry><title>&a;</title></entry></feed>"""
+
+
+def test_parse_published_entry():
+    (entry,) = parse_feed(FEED.encode())
+    assert entry.event == "published"
+    assert entry.video_id == "VID1"
+    assert entry.channel_id == "UCabc"
+    assert entry.title == "Video & title"
+    assert entry.url == "https://www.youtube.com/watch?v=VID1"
+    assert entry.channel_name == "Channel"
+    assert entry.channel_url == "https://www.youtube.com/channel/UCabc"
+
+
+def test_parse_utf16_feed():
+    body = FEED.replace("UTF-8", "UTF-16").encode("utf-16")
+    assert parse_feed(body) == parse_feed(FEED.encode())
+
+
+def test_parse_deleted_entry():
+    (entry,) = parse_feed(DELETED_FEED.encode())
+    assert entry.event == "deleted"
+    assert entry.video_id == "VID2"
+    assert entry.channel_id == "UCabc"
+
+
+def test_parse_multiple_entries():
+    start = FEED.index(" <entry>")
+    end = FEED.index("</feed>")
+    body = FEED[:end] + FEED[start:end].replace("VID1", "VID3") + "</feed>"
+    assert [e.video_id for e in parse_feed(body.encode())] == ["VID1", "VID3"]
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-16"])
+def test_dtd_is_refused(encoding):
+    body = DTD_FEED.replace("UTF-16", encoding.upper()).encode(encoding)
+    with pytest.raises(FeedError):
+        parse_feed(body)
+
+
+def test_large_feed_is_refused():
+    with pytest.raises(FeedError):
+        parse_feed(b" " * (FEED_MAX_SIZE + 1))
+
+
+def test_invalid_feed_is_refused():
+    with pytest.raises(FeedError):
+        parse_feed(b"<feed><entry></feed>")
+
+
+def test_benchmark_against_xmltodict():
+    """Compare with the xmltodict parsing used before, run with -s to see the results."""
+    xmltodict = pytest.importorskip("xmltodict")
+    body = FEED.encode()
+    runs = 2000
+
+    def _xmltodict():
+        entry = xmltodict.parse(body)["feed"]["entry"]
+        return (entry["yt:videoId"], entry["title"], entry["link"]["@href"])
+
+    def _parse_feed():
+        (entry,) = parse_feed(body)
+        return (entry.video_id, entry.title, entry.url)
+
+    assert _xmltodict() == _parse_feed()
+    results = {}
+    for name, func in (("xmltodict", _xmltodict), ("parse_feed", _parse_feed)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+
+        results[name] = (time.perf_counter() - start) / runs * 1e6
+
+    print()
+    for name, us in results.items():
+        print(f"{name}: {us:.1f}us per feed")
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+import pytest
+from types import SimpleNamespace
+from core.views.youtube import YouTubeView
+
+CHANNELS = 100000
+GUILDS = 1000
+
+
+class FakeBot:
+    def __init__(self, db):
+        self.db = db
+
+    def get_db(self, name, cog=True):
+        return self.db[name]
+
+
+def get_guild_channels(db, guild_id: int):
+    view = SimpleNamespace(ctx=SimpleNamespace(bot=FakeBot(db)))
+    return YouTubeView.get_guild_channels(view, guild_id)  # type: ignore
+
+
+def create_channels(count: int) -> list:
+    return [
+        {
+            "_id": f"UC{i:022d}",
+            "guilds": [i % GUILDS, (i * 7 + 1) % GUILDS],
+            "data": {"id": f"UC{i:022d}", "snippet": {"title": f"Channel {i}"}},
+        }
+        for i in range(count)
+    ]
+
+
+def test_only_the_guilds_channels_are_returned():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient().strapbot
+        await db.YouTubeNews.insert_many(
+            [
+                {"_id": "UC1", "guilds": [1], "data": {"id": "UC1"}},
+                {"_id": "UC2", "guilds": [1, 2], "data": {"id": "UC2"}},
+                {"_id": "UC3", "guilds": [2], "data": {"id": "UC3"}},
+                {"_id": "UC4", "guilds": [], "data": {"id": "UC4"}},
+            ]
+        )
+        return (
+            await get_guild_channels(db, 1),
+            await get_guild_channels(db, 2),
+            await get_guild_channels(db, 3),
+        )
+
+    first, second, third = asyncio.run(run())
+    assert sorted(c["id"] for c in first) == ["UC1", "UC2"]
+    assert sorted(c["id"] for c in second) == ["UC2", "UC3"]
+    assert third == []
+    # only the data is sent, not the whole document
+    assert all(set(c) == {"id"} for c in first + second)
+
+
+@pytest.mark.skipif(
+    not os.getenv("MONGO_TEST_URI"), reason="needs a MongoDB server in MONGO_TEST_URI"
+)
+def test_benchmark_guild_channels():
+    """
+    Compare reading every channel and filtering them here (how it was done
+    before) with the indexed query, over 100k synthetic channels.
+    Run with -s to see the results. The database is dropped after.
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(os.getenv("MONGO_TEST_URI"))
+        db = client.strapbot_benchmark
+        try:
+            await db.YouTubeNews.drop()
+            await db.YouTubeNews.insert_many(create_channels(CHANNELS))
+            await db.YouTubeNews.create_index("guilds", name="GuildsIndex")
+
+            start = time.perf_counter()
+            before = [
+                item["data"]
+                for item in await db.YouTubeNews.find().to_list(None)
+                if 1 in item["guilds"]
+            ]
+            before_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            after = await get_guild_channels(db, 1)
+            after_time = time.perf_counter() - start
+
+            plan = await db.YouTubeNews.find({"guilds": 1}, {"data": 1}).explain()
+            return before, before_time, after, after_time, plan
+        finally:
+            await client.drop_database("strapbot_benchmark")
+            client.close()
+
+    before, before_time, after, after_time, plan = asyncio.run(run())
+    print(
+        f"\n{CHANNELS} channels: {before_time * 1000:.1f}ms reading every channel, "
+        f"{after_time * 1000:.1f}ms with the guilds query"
+    )
+    assert sorted(c["id"] for c in after) == sorted(c["id"] for c in before)
+    assert "IXSCAN" in str(plan["queryPlanner"]["winningPlan"])
+    assert after_time < before_time